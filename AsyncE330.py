@@ -0,0 +1,409 @@
+#
+# ASYNCE330 - ASYNCIO TERMINAL CLIENT
+# E330 for asyncio applications: stdin is watched by the event loop, key
+# events come out of an async iterator and output goes through a buffered,
+# non-blocking writer. No threads, everything runs on the loop.
+#
+
+import asyncio
+import fcntl
+import os
+import sys
+import termios
+import tty
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from E330 import (
+    BEGIN_SYNCHRONIZED_UPDATE,
+    DISABLE_BRACKETED_PASTE,
+    ENABLE_BRACKETED_PASTE,
+    END_SYNCHRONIZED_UPDATE,
+    INPUT_CHUNK_SIZE,
+    INPUT_DRAIN_LIMIT,
+    RESTORE_SCREEN,
+    SAVE_SCREEN,
+    supports_synchronized_updates,
+)
+from IOEscape import IOEvent, IOKeyDecoder
+from Terminfo import Terminfo, load_terminfo
+
+# MARK: Classes
+@dataclass
+class AsyncTerminalWriter:
+    """
+    # AsyncTerminalWriter
+    @dataclass
+
+    Buffered writer for a non-blocking fd. Writes made during one pass of
+    the event loop are sent together by a single os.write; what the fd
+    does not take is sent when the loop sees it writable again.
+
+    Parameters:
+
+        (*) fd                      Output file descriptor
+                                    @Type: int
+
+        (*) high_water              Buffered bytes above which drain()
+                                    waits for the terminal
+                                    @Type: int
+                                    @Default: 64 KiB
+
+    Methods:
+
+        (*) write                   Buffer bytes, flushed on the next pass
+                                    of the loop
+
+        (*) hold / release          Keep buffering until released (frames)
+
+        (*) drain                   Wait until the buffer is below
+                                    high_water (async). Returns at once
+                                    while held, nothing can be sent then.
+
+        (*) flush                   Wait until everything is written
+                                    (async). RuntimeError while held, it
+                                    would never finish.
+    """
+
+    fd: int
+    high_water: int = 1 << 16
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    buffer: bytearray = field(default_factory=bytearray)
+    held: int = 0
+    scheduled: bool = False
+    watching: bool = False
+    # (future, wait for an empty buffer)
+    waiters: List[Tuple[asyncio.Future, bool]] = field(default_factory=list)
+    bytes_written: int = 0
+    writes: int = 0
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.buffer += data
+        self._schedule()
+
+    def hold(self):
+        self.held += 1
+
+    def release(self):
+        if self.held:
+            self.held -= 1
+        self._schedule()
+
+    async def drain(self):
+        if len(self.buffer) > self.high_water and not self.held:
+            await self._wait()
+
+    async def flush(self):
+        if self.held:
+            raise RuntimeError("AsyncTerminalWriter.flush() called while held, release it first")
+        if self.buffer:
+            self._schedule()
+            await self._wait(empty=True)
+
+    def close(self):
+        if self.watching:
+            self._loop().remove_writer(self.fd)
+            self.watching = False
+        # Whatever is left goes out blocking, the terminal is shut down
+        if self.buffer:
+            os.set_blocking(self.fd, True)
+            view = memoryview(bytes(self.buffer))
+            while view:
+                view = view[os.write(self.fd, view):]
+            self.buffer.clear()
+        self._wake(everyone=True)
+
+    def _loop(self) -> asyncio.AbstractEventLoop:
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        return self.loop
+
+    def _schedule(self):
+        if self.scheduled or self.watching or self.held or not self.buffer:
+            return
+        self.scheduled = True
+        self._loop().call_soon(self._send)
+
+    def _send(self):
+        self.scheduled = False
+        if self.held:
+            # release() schedules the next send
+            if self.watching:
+                self._loop().remove_writer(self.fd)
+                self.watching = False
+            return
+
+        while self.buffer:
+            try:
+                written = os.write(self.fd, self.buffer)
+            except BlockingIOError:
+                break
+            self.writes += 1
+            self.bytes_written += written
+            del self.buffer[:written]
+
+        # The terminal is behind, continue when it can take more
+        if self.buffer and not self.watching:
+            self._loop().add_writer(self.fd, self._send)
+            self.watching = True
+        elif not self.buffer and self.watching:
+            self._loop().remove_writer(self.fd)
+            self.watching = False
+
+        self._wake()
+
+    async def _wait(self, empty: bool = False):
+        waiter = self._loop().create_future()
+        self.waiters.append((waiter, empty))
+        await waiter
+
+    def _wake(self, everyone: bool = False):
+        size = len(self.buffer)
+        for entry in self.waiters[:]:
+            waiter, empty = entry
+            if everyone or size == 0 or (not empty and size <= self.high_water):
+                self.waiters.remove(entry)
+                if not waiter.done():
+                    waiter.set_result(None)
+
+@dataclass
+class AsyncE330:
+    """
+    # AsyncE330
+    @dataclass
+
+    Terminal client on an asyncio event loop. Use it as an async context
+    manager, and iterate it for input events:
+
+        async with AsyncE330() as terminal:
+            async for event in terminal:
+                ...
+
+    Input is read with loop.add_reader and decoded as it arrives, a held
+    ESC is resolved by a loop timer. Output written while a frame is open
+    is sent in one write, inside a synchronized update.
+
+    O_NONBLOCK belongs to the open file description, which a terminal's
+    stdin, stdout and stderr usually share; set on them, any print() or
+    logging to the terminal could fail with BlockingIOError. A tty is
+    therefore opened again, non-blocking, for descriptions of its own.
+    Other fds (pipes, files) get the flag directly and their old flags
+    back at shutdown.
+
+    Parameters:
+
+        (*) decoder                 Input decoder
+                                    @Type: IOKeyDecoder
+
+        (*) input_fd, output_fd     Terminal file descriptors
+                                    @Type: int
+                                    @Default: stdin, stdout
+
+        (*) bracketed_paste         Receive pastes as one IOPaste event
+                                    @Type: bool
+                                    @Default: True
+
+        (*) synchronized_updates    Wrap frames in mode 2026, None detects
+                                    support from $TERM
+                                    @Type: Optional[bool]
+
+        (*) terminfo                Capabilities of $TERM
+                                    @Type: Optional[Terminfo]
+    """
+
+    decoder: IOKeyDecoder = field(default_factory=IOKeyDecoder)
+    input_fd: int = field(default_factory=lambda: sys.stdin.fileno())
+    output_fd: int = field(default_factory=lambda: sys.stdout.fileno())
+    bracketed_paste: bool = True
+    synchronized_updates: Optional[bool] = None
+    terminfo: Optional[Terminfo] = field(default_factory=load_terminfo)
+    writer: AsyncTerminalWriter = field(init=False)
+    events: "asyncio.Queue[Optional[IOEvent]]" = field(init=False, default_factory=asyncio.Queue)
+    expire_handle: Optional[asyncio.TimerHandle] = field(init=False, default=None)
+    old_settings: Any = field(init=False, default=None)
+    frame_depth: int = field(init=False, default=0)
+    running: bool = field(init=False, default=False)
+    # Non-blocking fds used while running, and the flags of fds changed
+    # in place
+    read_fd: int = field(init=False, default=-1)
+    write_fd: int = field(init=False, default=-1)
+    saved_flags: Dict[int, int] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        if self.synchronized_updates is None:
+            self.synchronized_updates = supports_synchronized_updates()
+        if self.terminfo is not None and not self.decoder.key_sequences:
+            self.decoder.key_sequences = self.terminfo.key_sequences()
+        self.writer = AsyncTerminalWriter(self.output_fd)
+
+    # Terminal Initialization and Shutdown
+    async def __aenter__(self) -> "AsyncE330":
+        self.initialize_terminal()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.shutdown_terminal()
+
+    def initialize_terminal(self):
+        loop = asyncio.get_running_loop()
+        self.writer.loop = loop
+
+        if os.isatty(self.input_fd):
+            self.old_settings = termios.tcgetattr(self.input_fd)
+            tty.setraw(self.input_fd)
+        self.read_fd = self._open_nonblocking(self.input_fd, os.O_RDONLY)
+        self.write_fd = self._open_nonblocking(self.output_fd, os.O_WRONLY)
+        self.writer.fd = self.write_fd
+
+        loop.add_reader(self.read_fd, self._read)
+        self.running = True
+
+        self.print(SAVE_SCREEN)
+        if self.bracketed_paste:
+            self.print(ENABLE_BRACKETED_PASTE)
+
+    async def shutdown_terminal(self):
+        if not self.running:
+            return
+        self.running = False
+
+        asyncio.get_running_loop().remove_reader(self.read_fd)
+        if self.expire_handle is not None:
+            self.expire_handle.cancel()
+            self.expire_handle = None
+
+        if self.bracketed_paste:
+            self.print(DISABLE_BRACKETED_PASTE)
+        self.print(RESTORE_SCREEN)
+        # A frame left open goes out as it is
+        self.frame_depth = 0
+        self.writer.held = 0
+        await self.writer.flush()
+        self.writer.close()
+
+        self._close_nonblocking(self.read_fd, self.input_fd)
+        self._close_nonblocking(self.write_fd, self.output_fd)
+        self.writer.fd = self.output_fd
+        self.read_fd = self.write_fd = -1
+        if self.old_settings is not None:
+            termios.tcsetattr(self.input_fd, termios.TCSADRAIN, self.old_settings)
+            self.old_settings = None
+
+        # Ends the iterators
+        self.events.put_nowait(None)
+
+    def _open_nonblocking(self, fd: int, mode: int) -> int:
+        if os.isatty(fd):
+            try:
+                return os.open(os.ttyname(fd), mode | os.O_NOCTTY | os.O_NONBLOCK)
+            except OSError:
+                pass
+        # input_fd and output_fd may be the same, keep the first flags seen
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        self.saved_flags.setdefault(fd, flags)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        return fd
+
+    def _close_nonblocking(self, fd: int, original: int):
+        if fd != original:
+            os.close(fd)
+        elif fd in self.saved_flags:
+            fcntl.fcntl(fd, fcntl.F_SETFL, self.saved_flags.pop(fd))
+
+    # Output
+    def print(self, text: str):
+        self.writer.write(text.encode("utf-8"))
+
+    def write(self, data: bytes):
+        self.writer.write(data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+    # Frames, like E330: nested frames go out with the outermost one
+    def begin_frame(self):
+        if self.frame_depth == 0:
+            self.writer.hold()
+            if self.synchronized_updates:
+                self.writer.write(BEGIN_SYNCHRONIZED_UPDATE)
+        self.frame_depth += 1
+
+    def end_frame(self):
+        if self.frame_depth == 0:
+            return
+        self.frame_depth -= 1
+        if self.frame_depth == 0:
+            if self.synchronized_updates:
+                self.writer.write(END_SYNCHRONIZED_UPDATE)
+            self.writer.release()
+
+    @contextmanager
+    def frame(self) -> Iterator["AsyncE330"]:
+        self.begin_frame()
+        try:
+            yield self
+        finally:
+            self.end_frame()
+
+    # Input
+    def __aiter__(self) -> AsyncIterator[IOEvent]:
+        return self.iter_events()
+
+    async def iter_events(self) -> AsyncIterator[IOEvent]:
+        while True:
+            event = await self.events.get()
+            if event is None:
+                # Let other iterators end too
+                self.events.put_nowait(None)
+                return
+            yield event
+
+    def feed(self, data: bytes):
+        for event in self.decoder.feed(data):
+            self.events.put_nowait(event)
+        self._schedule_expire()
+
+    def _read(self):
+        # Everything available, a whole paste is decoded in one callback
+        chunks: List[bytes] = []
+        size = 0
+        closed = False
+        try:
+            while size < INPUT_DRAIN_LIMIT:
+                chunk = os.read(self.read_fd, INPUT_CHUNK_SIZE)
+                if not chunk:
+                    closed = True
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+                if len(chunk) < INPUT_CHUNK_SIZE:
+                    break
+        except BlockingIOError:
+            pass
+        except OSError:
+            closed = True
+
+        if chunks:
+            self.feed(b"".join(chunks))
+
+        if closed:
+            asyncio.get_running_loop().remove_reader(self.read_fd)
+            self.events.put_nowait(None)
+
+    def _schedule_expire(self):
+        if self.expire_handle is not None:
+            self.expire_handle.cancel()
+            self.expire_handle = None
+
+        timeout = self.decoder.timeout()
+        if timeout is not None:
+            self.expire_handle = asyncio.get_running_loop().call_later(timeout, self._expire)
+
+    def _expire(self):
+        self.expire_handle = None
+        for event in self.decoder.expire():
+            self.events.put_nowait(event)
+        self._schedule_expire()
@@ -0,0 +1,127 @@
+#
+# CTRLBYTES - BYTES NATIVE ESCAPE SEQUENCE ENCODER
+# Same sequences as CtrlCodes, written straight into a bytearray so a whole
+# frame can be built in one buffer without intermediate strings.
+#
+
+from typing import Dict, Tuple
+
+ESC = b"\033"
+CSI = b"\033["
+RESET = b"\033[0m"
+BOLD = b"\033[1m"
+DIM = b"\033[2m"
+UNDERLINED = b"\033[4m"
+BLINK = b"\033[5m"
+REVERSE = b"\033[7m"
+HIDDEN = b"\033[8m"
+
+CLEAR_SCREEN = b"\033[2J"
+CLEAR_LINE = b"\033[2K"
+SAVE_CURSOR_POSITION = b"\033[s"
+RESTORE_CURSOR_POSITION = b"\033[u"
+CURSOR_BEGINNING_OF_LINE = b"\033[G"
+CURSOR_HOME = b"\033[H"
+
+# MARK: Tables
+# Decimal parameters 0-999, pre-encoded
+NUMBERS: Tuple[bytes, ...] = tuple(str(n).encode() for n in range(1000))
+
+# Basic colors by ANSI color number (0-7, 9 is the default color)
+FG: Tuple[bytes, ...] = tuple(b"\033[3" + NUMBERS[n] + b"m" for n in range(10))
+BG: Tuple[bytes, ...] = tuple(b"\033[4" + NUMBERS[n] + b"m" for n in range(10))
+
+# 256 color palette
+FG_256: Tuple[bytes, ...] = tuple(b"\033[38;5;" + NUMBERS[n] + b"m" for n in range(256))
+BG_256: Tuple[bytes, ...] = tuple(b"\033[48;5;" + NUMBERS[n] + b"m" for n in range(256))
+
+# Cursor position prefixes by row, "ESC [ row ;"
+CURSOR_ROW: Tuple[bytes, ...] = tuple(CSI + NUMBERS[n] + b";" for n in range(1000))
+
+# Every basic foreground / background pair in one sequence, FG_BG[fg][bg]
+FG_BG: Tuple[Tuple[bytes, ...], ...] = tuple(
+    tuple(b"\033[3" + NUMBERS[fg] + b";4" + NUMBERS[bg] + b"m" for bg in range(10))
+    for fg in range(10)
+)
+
+# SGR sequences by parameter tuple, filled on demand
+sgr_cache: Dict[Tuple[int, ...], bytes] = {}
+
+# MARK: Functions
+def number(n: int) -> bytes:
+    if 0 <= n < 1000:
+        return NUMBERS[n]
+    return str(n).encode()
+
+def sgr(*parameters: int) -> bytes:
+    # Any combination of SGR parameters, e.g. sgr(1, 4, 31)
+    sequence = sgr_cache.get(parameters)
+    if sequence is None:
+        sequence = CSI + b";".join(number(p) for p in parameters) + b"m"
+        sgr_cache[parameters] = sequence
+    return sequence
+
+def put_cursor_position(buffer: bytearray, row: int = 1, col: int = 1):
+    if 0 <= row < 1000:
+        buffer += CURSOR_ROW[row]
+    else:
+        buffer += CSI + number(row) + b";"
+    buffer += number(col)
+    buffer += b"H"
+
+def put_csi(buffer: bytearray, n: int, final: bytes):
+    # CSI n <final>, the shape of every single parameter motion
+    buffer += CSI
+    buffer += number(n)
+    buffer += final
+
+def put_cursor_up(buffer: bytearray, n: int = 1):
+    put_csi(buffer, n, b"A")
+
+def put_cursor_down(buffer: bytearray, n: int = 1):
+    put_csi(buffer, n, b"B")
+
+def put_cursor_forward(buffer: bytearray, n: int = 1):
+    put_csi(buffer, n, b"C")
+
+def put_cursor_backward(buffer: bytearray, n: int = 1):
+    put_csi(buffer, n, b"D")
+
+def put_cursor_next_line(buffer: bytearray, n: int = 1):
+    put_csi(buffer, n, b"E")
+
+def put_cursor_prev_line(buffer: bytearray, n: int = 1):
+    put_csi(buffer, n, b"F")
+
+def put_cursor_to_column(buffer: bytearray, n: int = 1):
+    put_csi(buffer, n, b"G")
+
+def put_move_cursor_horizontal(buffer: bytearray, n: int = 1):
+    if n < 0:
+        put_csi(buffer, -n, b"D")
+    elif n > 0:
+        put_csi(buffer, n, b"C")
+
+def put_sgr(buffer: bytearray, *parameters: int):
+    buffer += sgr(*parameters)
+
+def put_fg_color(buffer: bytearray, r: int, g: int, b: int):
+    buffer += b"\033[38;2;"
+    buffer += NUMBERS[r]
+    buffer += b";"
+    buffer += NUMBERS[g]
+    buffer += b";"
+    buffer += NUMBERS[b]
+    buffer += b"m"
+
+def put_bg_color(buffer: bytearray, r: int, g: int, b: int):
+    buffer += b"\033[48;2;"
+    buffer += NUMBERS[r]
+    buffer += b";"
+    buffer += NUMBERS[g]
+    buffer += b";"
+    buffer += NUMBERS[b]
+    buffer += b"m"
+
+def put_text(buffer: bytearray, text: str):
+    buffer += text.encode("utf-8")
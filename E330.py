@@ -11,38 +11,349 @@ from os import linesep
 from re import X
 import threading
 import sys
+import os
+import select
+import signal
+import struct
+import time
+import fcntl
 import tty
 import termios
+import codecs
+from contextlib import contextmanager
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import Callable, List
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from InputQueue import InputQueue
+from IOEscape import IOEvent, IOKeyDecoder, IOKeycode, IOResize, coalesce_mouse_events
+from Terminfo import Terminfo, load_terminfo
 
 # Constants
 SAVE_SCREEN = "\033[?1049h\033[?25l"
 RESTORE_SCREEN = "\033[?1049l\033[?25h"
+# Pastes arrive wrapped in ESC [ 200 ~ ... ESC [ 201 ~
+ENABLE_BRACKETED_PASTE = "\033[?2004h"
+DISABLE_BRACKETED_PASTE = "\033[?2004l"
+# Mouse reports in the SGR format (ESC [ < b ; x ; y M/m)
+SGR_MOUSE_MODE = 1006
+# DEC private mode 2026, the terminal holds the screen until the end
+BEGIN_SYNCHRONIZED_UPDATE = b"\033[?2026h"
+END_SYNCHRONIZED_UPDATE = b"\033[?2026l"
+# Terminals too old to be trusted with unknown private modes
+NO_SYNCHRONIZED_UPDATE_TERMS = ("dumb", "linux", "vt")
+# Most bytes taken from stdin per read
+INPUT_CHUNK_SIZE = 4096
+# Most bytes drained from stdin before they are decoded
+INPUT_DRAIN_LIMIT = 1 << 20
+# Most characters kept in input_buffer, older ones are discarded
+INPUT_BUFFER_LIMIT = 4096
+# Seconds without a SIGWINCH before a resize is reported
+RESIZE_DEBOUNCE = 0.05
+# Size assumed when the terminal does not report one
+DEFAULT_SIZE = (80, 24)
+# Buffered output is written once it reaches this size...
+OUTPUT_FLUSH_SIZE = 1 << 16
+# ...or once the oldest buffered byte is this old (seconds)
+OUTPUT_FLUSH_INTERVAL = 0.016
+
+def supports_synchronized_updates() -> bool:
+    # Terminals without mode 2026 ignore it, so only rule out the ones
+    # that might not.
+    term = os.environ.get("TERM", "")
+    return bool(term) and not term.startswith(NO_SYNCHRONIZED_UPDATE_TERMS)
+
+@dataclass(frozen=True)
+class TerminalSize:
+    # Same shape as View2DConstraint, so it can be the root constraint
+    width: int
+    height: int
+
+class MouseTracking(Enum):
+    CLICKS = 1000   # press, release and wheel
+    DRAG = 1002     # and motion while a button is held
+    ALL = 1003      # and all motion
 
 @dataclass
 class E330:
     input_buffer: str = ""
     subscribers: List[Callable[[str], None]] = field(default_factory=list)
+    key_subscribers: List[Callable[[IOEvent], None]] = field(default_factory=list)
+    decoder: IOKeyDecoder = field(default_factory=IOKeyDecoder)
+    text_decoder: Any = field(init=False, default_factory=lambda: codecs.getincrementaldecoder("utf-8")(errors="replace"))
     input_thread: threading.Thread = field(init=False, default=None)
     stop_input_event: threading.Event = field(init=False, default_factory=threading.Event)
+    # Self-pipe (read end, write end) waking the reader to stop
+    wakeup_pipe: Optional[Tuple[int, int]] = field(init=False, default=None)
+    # None detects support from $TERM
+    synchronized_updates: Optional[bool] = None
+    bracketed_paste: bool = True
+    mouse_tracking: Optional[MouseTracking] = field(init=False, default=None)
+    frame_depth: int = field(init=False, default=0)
+    frame_buffer: bytearray = field(init=False, default_factory=bytearray)
+    # Capabilities of $TERM, None if it has no terminfo entry
+    terminfo: Optional[Terminfo] = field(default_factory=load_terminfo)
+    # Input goes through the queue to the subscribers, see process_input().
+    # None calls the subscribers right away, on the reader thread. Keys
+    # are never dropped: when the queue is full the reader blocks (the
+    # BLOCK policy) until process_input() makes room, and input waits in
+    # the tty meanwhile. Mouse motion is merged per read and per batch.
+    input_queue: Optional[InputQueue] = field(default_factory=InputQueue)
+    input_buffer_limit: int = INPUT_BUFFER_LIMIT
+    # Cached terminal size, read again once per resize (see poll_resize)
+    size: Optional[TerminalSize] = field(init=False, default=None)
+    resize_debounce: float = RESIZE_DEBOUNCE
+    resize_since: Optional[float] = field(init=False, default=None)
+    previous_sigwinch: Any = field(init=False, default=None)
+    # Output is buffered and written to the raw fd, see flush()
+    output_fd: Optional[int] = None
+    flush_size: int = OUTPUT_FLUSH_SIZE
+    flush_interval: float = OUTPUT_FLUSH_INTERVAL
+    output_buffer: bytearray = field(init=False, default_factory=bytearray)
+    output_since: float = field(init=False, default=0.0)
+    # Guards the output buffer, and wakes the flush thread
+    output_lock: threading.Condition = field(init=False, default_factory=threading.Condition)
+    # When the flush thread sends the buffer, None while it is empty
+    flush_deadline: Optional[float] = field(init=False, default=None)
+    flush_thread: Optional[threading.Thread] = field(init=False, default=None)
+    bytes_written: int = field(init=False, default=0)
+    write_calls: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        if self.synchronized_updates is None:
+            self.synchronized_updates = supports_synchronized_updates()
+        if self.terminfo is not None and not self.decoder.key_sequences:
+            self.decoder.key_sequences = self.terminfo.key_sequences()
 
     # Terminal Initialization and Shutdown
     def initialize_terminal(self):
-        print(SAVE_SCREEN, end='', flush=True)
+        self.install_resize_handler()
+        self.print(SAVE_SCREEN)
+        if self.bracketed_paste:
+            self.enable_bracketed_paste()
+        self.flush()
 
     def shutdown_terminal(self):
+        self.restore_terminal()
+        exit(0)
+
+    def restore_terminal(self):
         # Unsuscribe all subscribers
         self.subscribers.clear()
+        self.key_subscribers.clear()
 
-        print(RESTORE_SCREEN, end='', flush=True)
-        exit(0)
+        if self.bracketed_paste:
+            self.disable_bracketed_paste()
+        self.disable_mouse_tracking()
+        self.uninstall_resize_handler()
+        self.print(RESTORE_SCREEN)
+        self.flush()
+        self.stop_flush_thread()
+
+    def enable_bracketed_paste(self):
+        self.print(ENABLE_BRACKETED_PASTE)
+
+    def disable_bracketed_paste(self):
+        self.print(DISABLE_BRACKETED_PASTE)
+
+    def enable_mouse_tracking(self, mode: MouseTracking = MouseTracking.DRAG):
+        # Mouse events reach the key subscribers as IOMouseEvent
+        self.disable_mouse_tracking()
+        self.print(f"\033[?{mode.value}h\033[?{SGR_MOUSE_MODE}h")
+        self.mouse_tracking = mode
+
+    def disable_mouse_tracking(self):
+        if self.mouse_tracking is None:
+            return
+        self.print(f"\033[?{SGR_MOUSE_MODE}l\033[?{self.mouse_tracking.value}l")
+        self.mouse_tracking = None
+
+
+    # Terminal Size
+    # SIGWINCH only notes the time, the size is read with one ioctl once the
+    # signals stop for resize_debounce seconds, and reported as one IOResize.
+    # Layouts use the cached size: view.render(parent_callback=terminal.get_size)
+    def get_size(self) -> TerminalSize:
+        if self.size is None:
+            self.size = self.read_size()
+        return self.size
+
+    def read_size(self) -> TerminalSize:
+        for fd in (self.output_fd, sys.stdout, sys.stdin):
+            try:
+                fd = fd if isinstance(fd, int) else fd.fileno()
+                rows, columns, _, _ = struct.unpack("HHHH", fcntl.ioctl(fd, termios.TIOCGWINSZ, b"\0" * 8))
+            except (OSError, ValueError, AttributeError, TypeError):
+                continue
+            if rows and columns:
+                return TerminalSize(columns, rows)
+        return TerminalSize(*DEFAULT_SIZE)
 
+    def install_resize_handler(self):
+        # Signal handlers can only be set from the main thread
+        if threading.current_thread() is not threading.main_thread():
+            return
+        self.previous_sigwinch = signal.signal(signal.SIGWINCH, self.handle_sigwinch)
+
+    def uninstall_resize_handler(self):
+        if self.previous_sigwinch is not None:
+            signal.signal(signal.SIGWINCH, self.previous_sigwinch)
+            self.previous_sigwinch = None
+
+    def handle_sigwinch(self, signum, frame):
+        self.resize_since = time.monotonic()
+        # Wake the reader so it waits for the debounce instead
+        if self.wakeup_pipe is not None:
+            try:
+                os.write(self.wakeup_pipe[1], b"\0")
+            except OSError:
+                pass
+
+    def resize_timeout(self) -> Optional[float]:
+        if self.resize_since is None:
+            return None
+        return max(0.0, self.resize_since + self.resize_debounce - time.monotonic())
+
+    def poll_resize(self) -> Optional[IOResize]:
+        remaining = self.resize_timeout()
+        if remaining is None or remaining > 0:
+            return None
+
+        self.resize_since = None
+        size = self.read_size()
+        if size == self.size:
+            return None
+
+        self.size = size
+        event = IOResize(size.width, size.height)
+        self.dispatch_events([event])
+        return event
 
     # Output Method
+    # Output is collected in a bytes buffer and written to the stdout fd in
+    # one syscall when it grows past flush_size, flush_interval seconds
+    # after its first byte (by the flush thread, so output is sent without
+    # further writes), at the end of a frame, or on flush(). Loops that print and
+    # then wait may call flush() to send at once.
     def print(self, text):
-        print(text, end='', flush=True)
+        self.write(text.encode("utf-8"))
+
+    def write(self, data: bytes):
+        # Raw bytes, e.g. from OutputBuilder.build()
+        if self.frame_depth:
+            self.frame_buffer += data
+            return
+
+        with self.output_lock:
+            now = time.monotonic()
+            if not self.output_buffer:
+                self.output_since = now
+            self.output_buffer += data
+            due = len(self.output_buffer) >= self.flush_size or now - self.output_since >= self.flush_interval
+            if not due and self.flush_deadline is None:
+                self.flush_deadline = self.output_since + self.flush_interval
+                if self.flush_thread is None:
+                    self.start_flush_thread()
+                self.output_lock.notify()
+
+        if due:
+            self.flush()
+
+    def start_flush_thread(self):
+        # One thread for the life of the terminal, started by the first
+        # buffered write. It sleeps until flush_deadline.
+        with self.output_lock:
+            if self.flush_thread is None:
+                self.flush_thread = threading.Thread(target=self.flush_loop, name="E330 flush", daemon=True)
+                self.flush_thread.start()
+
+    def stop_flush_thread(self):
+        with self.output_lock:
+            thread = self.flush_thread
+            self.flush_thread = None
+            self.output_lock.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def flush_loop(self):
+        with self.output_lock:
+            while self.flush_thread is threading.current_thread():
+                if self.flush_deadline is None:
+                    self.output_lock.wait()
+                    continue
+
+                remaining = self.flush_deadline - time.monotonic()
+                if remaining > 0:
+                    self.output_lock.wait(remaining)
+                    continue
+
+                try:
+                    self.flush()
+                except OSError:
+                    # The terminal is gone, nothing left to send to
+                    self.flush_deadline = None
+
+    def flush(self):
+        with self.output_lock:
+            self.flush_deadline = None
+            if not self.output_buffer:
+                return
+
+            # Text written through sys.stdout goes first
+            sys.stdout.flush()
+            fd = self.output_fd if self.output_fd is not None else sys.stdout.fileno()
+
+            view = memoryview(self.output_buffer)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+                self.write_calls += 1
+                self.bytes_written += written
+            view.release()
+            self.output_buffer.clear()
+
+    def output_writable(self) -> bool:
+        # False while the terminal has not taken earlier output and a write
+        # would block. Unknown counts as writable.
+        fd = self.output_fd if self.output_fd is not None else sys.stdout.fileno()
+        try:
+            return bool(select.select([], [fd], [], 0)[1])
+        except (OSError, ValueError):
+            return True
+
+    # Frames
+    # Everything printed between begin_frame and end_frame is sent with a
+    # single write, wrapped in a synchronized update so the terminal
+    # presents it at once. Frames nest, only the outermost one writes.
+    def begin_frame(self):
+        self.frame_depth += 1
+
+    def end_frame(self):
+        if self.frame_depth == 0:
+            return
+
+        self.frame_depth -= 1
+        if self.frame_depth or not self.frame_buffer:
+            return
+
+        data = bytes(self.frame_buffer)
+        self.frame_buffer.clear()
+
+        if self.synchronized_updates:
+            data = BEGIN_SYNCHRONIZED_UPDATE + data + END_SYNCHRONIZED_UPDATE
+
+        # Anything printed before the frame goes out in the same write
+        with self.output_lock:
+            self.output_buffer += data
+        self.flush()
+
+    @contextmanager
+    def frame(self) -> Iterator["E330"]:
+        self.begin_frame()
+        try:
+            yield self
+        finally:
+            self.end_frame()
 
     # Subscription Events
     def subscribe_to_input(self, callback: Callable[[str], None]):
@@ -53,36 +364,151 @@ class E330:
         if callback in self.subscribers:
             self.subscribers.remove(callback)
 
+    # Decoded key (and paste) events, straight from the raw input bytes
+    def subscribe_to_keys(self, callback: Callable[[IOEvent], None]):
+        if callback not in self.key_subscribers:
+            self.key_subscribers.append(callback)
+
+    def unsubscribe_from_keys(self, callback: Callable[[IOEvent], None]):
+        if callback in self.key_subscribers:
+            self.key_subscribers.remove(callback)
+
     # Input Handling
     def handle_input(self, char: str):
         self.input_buffer += char
+        if len(self.input_buffer) > self.input_buffer_limit:
+            self.input_buffer = self.input_buffer[-self.input_buffer_limit:]
+
+        if self.input_queue is not None:
+            self.input_queue.put(char)
+            return
         for callback in self.subscribers:
             callback(char)
 
+    def handle_input_bytes(self, data: bytes) -> List[IOEvent]:
+        events = self.decoder.feed(data)
+        self.dispatch_events(events)
+
+        # Text subscribers get the whole chunk, decoded
+        if self.subscribers:
+            text = self.text_decoder.decode(data)
+            if text:
+                self.handle_input(text)
+
+        return events
+
+    def dispatch_events(self, events: List[IOEvent]):
+        if self.input_queue is not None:
+            if events:
+                self.input_queue.put_many(events)
+            return
+        for event in events:
+            for callback in self.key_subscribers:
+                callback(event)
+
+    def process_input(self, max_events: Optional[int] = None, timeout: float = 0) -> int:
+        # Call the subscribers for a batch of queued input, on the calling
+        # thread. Waits up to timeout seconds if nothing is queued.
+        if self.input_queue is None:
+            return 0
+
+        batch = self.input_queue.drain(max_events, timeout)
+        # Motion reports queued by several reads still come out as one,
+        # the latest position per batch
+        if self.decoder.coalesce_motion:
+            batch = coalesce_mouse_events(batch)
+        for item in batch:
+            if isinstance(item, str):
+                for callback in self.subscribers:
+                    callback(item)
+            else:
+                for callback in self.key_subscribers:
+                    callback(item)
+        return len(batch)
+
     def flush_input_buffer(self):
         self.input_buffer = ""
 
     def read_input(self):
         fd = sys.stdin.fileno()
+        wakeup = self.wakeup_pipe[0] if self.wakeup_pipe is not None else None
+        watched = [fd] if wakeup is None else [fd, wakeup]
         old_settings = termios.tcgetattr(fd)
         try:
             tty.setraw(fd)
             while not self.stop_input_event.is_set():
-                char = sys.stdin.read(1)
-                if char:
-                    self.handle_input(char)
-                if char == '\x03':  # Ctrl+C to exit
+                # Wait no longer than a held escape sequence may stay
+                # pending, then resolve it (a lone ESC becomes Escape).
+                # stop_input_thread writes to the pipe to end the wait,
+                # SIGWINCH to start the resize debounce.
+                timeout = self.decoder.timeout()
+                resize = self.resize_timeout()
+                if resize is not None and (timeout is None or resize < timeout):
+                    timeout = resize
+
+                ready, _, _ = select.select(watched, [], [], timeout)
+                self.poll_resize()
+                if wakeup in ready:
+                    os.read(wakeup, INPUT_CHUNK_SIZE)
+                    continue
+                if not ready:
+                    self.dispatch_events(self.decoder.expire())
+                    continue
+
+                data = self.drain_input(fd)
+                if not data:
+                    break
+                events = self.handle_input_bytes(data)
+                if any(isinstance(event, IOKeycode) and event.keycode == 0x03 for event in events):  # Ctrl+C to exit
                     break
         finally:
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
 
+    def drain_input(self, fd: int) -> bytes:
+        # Everything the fd has right now, in as few reads as possible.
+        # Only the first read may block, select said it will not.
+        data = os.read(fd, INPUT_CHUNK_SIZE)
+        if len(data) < INPUT_CHUNK_SIZE:
+            return data
+
+        chunks = [data]
+        size = len(data)
+        while size < INPUT_DRAIN_LIMIT and select.select([fd], [], [], 0)[0]:
+            chunk = os.read(fd, INPUT_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        return b"".join(chunks)
+
     # Threading
     def start_input_thread(self):
+        self.stop_input_event.clear()
+        if self.input_queue is not None:
+            self.input_queue.reopen()
+        if self.wakeup_pipe is None:
+            self.wakeup_pipe = os.pipe()
+            # Signal handlers write to it, they must never block
+            os.set_blocking(self.wakeup_pipe[1], False)
         self.input_thread = threading.Thread(target=self.read_input, daemon=True)
         self.input_thread.start()
 
     def stop_input_thread(self):
         self.stop_input_event.set()
+        # A reader blocked on a full queue gives up
+        if self.input_queue is not None:
+            self.input_queue.close()
+        if self.wakeup_pipe is not None:
+            try:
+                os.write(self.wakeup_pipe[1], b"\0")
+            except BlockingIOError:
+                # Full, the reader is woken anyway
+                pass
         if self.input_thread is not None:
             print("Stopping input thread")
             self.input_thread.join()
+            self.input_thread = None
+        if self.wakeup_pipe is not None:
+            os.close(self.wakeup_pipe[0])
+            os.close(self.wakeup_pipe[1])
+            self.wakeup_pipe = None
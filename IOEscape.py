@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import codecs
 import re
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Optional, Tuple, Union
 from enum import Enum, auto
 
 # MARK: Constants
@@ -8,9 +10,48 @@ ESCAPE_CHAR_RAW = '\x1b'
 ESCAPE_SEQUENCE = "<esc>"
 extra_key_map = {
     0x7f: "<backspace>",
-    0x09: "<tab>"
+    0x08: "<backspace>",
+    0x09: "<tab>",
+    0x0a: "<enter>",
+    0x0d: "<enter>",
+    0x03: "<ctrl+c>"
 }
 
+# Name of every single byte control key, indexed by the raw byte ("" if none)
+CONTROL_KEYS: Tuple[str, ...] = tuple(extra_key_map.get(byte, "") for byte in range(256))
+
+# The same keys in the textual form escape_escape produces, e.g. "\\r",
+# and the other spellings parse_extra_key has always accepted
+ESCAPED_CONTROL_KEYS: Tuple[Tuple[str, str], ...] = tuple(
+    (chr(byte).encode("unicode_escape").decode("ascii"), name)
+    for byte, name in extra_key_map.items()
+) + (
+    ("\\b", "<backspace>"),
+    ("\\x09", "<tab>"),
+    ("\\x0D", "<enter>"),
+)
+
+# Decoder states
+STATE_GROUND = 0
+STATE_ESCAPE = 1
+STATE_CSI = 2
+STATE_SS3 = 3
+STATE_PASTE = 4
+
+# Bracketed paste markers, ESC [ 200 ~ <text> ESC [ 201 ~
+PASTE_START_PARAMETERS = b"200"
+PASTE_END = b"\x1b[201~"
+
+# Longest CSI parameter string kept before the sequence is dropped
+MAX_CSI_LENGTH = 32
+
+# Seconds an incomplete escape sequence waits for the rest before it is
+# taken as typed (a lone ESC becomes the Escape key)
+ESCAPE_TIMEOUT = 0.01
+
+# Run of bytes that decode to text (no C0 controls, ESC or DEL)
+TEXT_RUN = re.compile(rb"[^\x00-\x1f\x7f]+")
+
 # MARK: Enums
 class IOEscape(Enum):
     NONE = auto()
@@ -21,24 +62,97 @@ class IOEscape(Enum):
     KEYCODE_SEQUENCE = auto()
     INCOMPLETE = auto()
 
+class IOMouseAction(Enum):
+    PRESS = auto()
+    RELEASE = auto()
+    DRAG = auto()
+    MOVE = auto()
+    WHEEL = auto()
+
 class IOTerminalStandard(Enum):
     XTERM = auto()
     VT = auto()
+    TERMINFO = auto()
     UNKNOWN = auto()
 
 # MARK: Classes
-@dataclass
+@dataclass(frozen=True, slots=True)
 class IOModifiers:
     SHIFT: bool = False
     ALT: bool = False
     CTRL: bool = False
     META: bool = False
 
-@dataclass
+    def mask(self) -> int:
+        return self.SHIFT | self.ALT << 1 | self.CTRL << 2 | self.META << 3
+
+# MARK: Tables
+# Shared, immutable modifier sets by bit mask (shift 1, alt 2, ctrl 4, meta 8)
+MODIFIERS = tuple(
+    IOModifiers(SHIFT=bool(m & 1), ALT=bool(m & 2), CTRL=bool(m & 4), META=bool(m & 8))
+    for m in range(16)
+)
+NO_MODIFIERS = MODIFIERS[0]
+
+MODIFIER_PREFIXES = tuple(
+    ("Shift+" if m & 1 else "") + ("Alt+" if m & 2 else "") + ("Ctrl+" if m & 4 else "") + ("Meta+" if m & 8 else "")
+    for m in range(16)
+)
+
+# Human readable key names, partially from https://invisible-island.net/xterm/ctlseqs/ctlseqs.html
+# VT keys by keycode: ESC [ keycode ~
+VT_KEY_NAMES: Dict[int, str] = {
+    1: "Home",
+    2: "Insert",
+    3: "Delete",
+    4: "End",
+    5: "PgUp",
+    6: "PgDn",
+    7: "Home",
+    8: "End",
+    10: "F0",
+    11: "F1",
+    12: "F2",
+    13: "F3",
+    14: "F4",
+    15: "F5",
+    17: "F6",
+    18: "F7",
+    19: "F8",
+    20: "F9",
+    21: "F10",
+    23: "F11",
+    24: "F12",
+    25: "F13",
+    26: "F14",
+    28: "F15",
+    29: "F16",
+    31: "F17",
+    32: "F18",
+    33: "F19",
+    34: "F20",
+}
+
+# XTERM keys by final character: ESC [ (1 ; modifier) char, or ESC O char
+XTERM_KEY_NAMES: Dict[str, str] = {
+    "A": "Up",
+    "B": "Down",
+    "C": "Right",
+    "D": "Left",
+    "F": "End",
+    "G": "Keypad 5",
+    "H": "Home",
+    "P": "F1",
+    "Q": "F2",
+    "R": "F3",
+    "S": "F4",
+}
+
+@dataclass(slots=True)
 class IOKeycode:
     """
     # IOKeycode
-    @dataclass
+    @dataclass(slots=True)
 
     This class is used to represent a keypress event, and contains all the necessary information to process the keypress.
 
@@ -65,12 +179,6 @@ class IOKeycode:
         (*) escape_sequence         Escape sequence of the keypress
                                     @Type: str
 
-        (*) vt_sequences            Dictionary of VT sequences
-                                    @Type: Dict[str, str]
-
-        (*) xterm_sequences         Dictionary of XTERM sequences
-                                    @Type: Dict[str, str]
-
         (*) was_terminated          Whether the raw keycode was terminated
                                     @Type: bool
 
@@ -101,76 +209,6 @@ class IOKeycode:
     escape_sequence: str
     terminated: bool
 
-    # Initialize human readable key based on escape sequence
-    # List partially from https://invisible-island.net/xterm/ctlseqs/ctlseqs.html
-    def __post_init__(self):
-        self.vt_sequences = {
-            self.escape_sequence + "[1~": "Home",
-            self.escape_sequence + "[2~": "Insert",
-            self.escape_sequence + "[3~": "Delete",
-            self.escape_sequence + "[4~": "End",
-            self.escape_sequence + "[5~": "PgUp",
-            self.escape_sequence + "[6~": "PgDn",
-            self.escape_sequence + "[7~": "Home",
-            self.escape_sequence + "[8~": "End",
-            self.escape_sequence + "[9~": "",
-            self.escape_sequence + "[10~": "F0",
-            self.escape_sequence + "[11~": "F1",
-            self.escape_sequence + "[12~": "F2",
-            self.escape_sequence + "[13~": "F3",
-            self.escape_sequence + "[14~": "F4",
-            self.escape_sequence + "[15~": "F5",
-            self.escape_sequence + "[16~": "",
-            self.escape_sequence + "[17~": "F6",
-            self.escape_sequence + "[18~": "F7",
-            self.escape_sequence + "[19~": "F8",
-            self.escape_sequence + "[20~": "F9",
-            self.escape_sequence + "[21~": "F10",
-            self.escape_sequence + "[22~": "",
-            self.escape_sequence + "[23~": "F11",
-            self.escape_sequence + "[24~": "F12",
-            self.escape_sequence + "[25~": "F13",
-            self.escape_sequence + "[26~": "F14",
-            self.escape_sequence + "[27~": "",
-            self.escape_sequence + "[28~": "F15",
-            self.escape_sequence + "[29~": "F16",
-            self.escape_sequence + "[30~": "",
-            self.escape_sequence + "[31~": "F17",
-            self.escape_sequence + "[32~": "F18",
-            self.escape_sequence + "[33~": "F19",
-            self.escape_sequence + "[34~": "F20",
-            self.escape_sequence + "[35~": ""
-        }
-
-        self.xterm_sequences = {
-            self.escape_sequence + "[A": "Up",
-            self.escape_sequence + "[B": "Down",
-            self.escape_sequence + "[C": "Right",
-            self.escape_sequence + "[D": "Left",
-            self.escape_sequence + "[E": "",
-            self.escape_sequence + "[F": "End",
-            self.escape_sequence + "[G": "Keypad 5",
-            self.escape_sequence + "[H": "Home",
-            self.escape_sequence + "[I": "",
-            self.escape_sequence + "[J": "",
-            self.escape_sequence + "[K": "",
-            self.escape_sequence + "[L": "",
-            self.escape_sequence + "[M": "",
-            self.escape_sequence + "[N": "",
-            self.escape_sequence + "[O": "",
-            self.escape_sequence + "[1P": "F1",
-            self.escape_sequence + "[1Q": "F2",
-            self.escape_sequence + "[1R": "F3",
-            self.escape_sequence + "[1S": "F4",
-            self.escape_sequence + "[T": "",
-            self.escape_sequence + "[U": "",
-            self.escape_sequence + "[V": "",
-            self.escape_sequence + "[W": "",
-            self.escape_sequence + "[X": "",
-            self.escape_sequence + "[Y": "",
-            self.escape_sequence + "[Z": ""
-        }
-
     def is_special(self) -> bool:
         """
         # is_special
@@ -190,29 +228,19 @@ class IOKeycode:
         return self.escape_type in {IOEscape.ALT_BRACKET, IOEscape.INCOMPLETE, IOEscape.ESC}
 
     def resolve_friendly_name(self, include_modifiers: bool = True) -> str:
-        modifier_names = []
-        if self.modifier.SHIFT:
-            modifier_names.append("Shift+")
-        if self.modifier.ALT:
-            modifier_names.append("Alt+")
-        if self.modifier.CTRL:
-            modifier_names.append("Ctrl+")
-        if self.modifier.META:
-            modifier_names.append("Meta+")
-
         key_name = ""
         if self.terminal == IOTerminalStandard.VT:
-            key_name = self.vt_sequences.get(f"{self.escape_sequence}[{self.keycode_char}~", "")
+            key_name = VT_KEY_NAMES.get(self.keycode, "")
         elif self.terminal == IOTerminalStandard.XTERM:
-            key_name = self.xterm_sequences.get(f"{self.escape_sequence}[{self.keycode_char}", "")
+            key_name = XTERM_KEY_NAMES.get(self.keycode_char, "")
 
         if not key_name:
             key_name = self.keycode_char
 
         if include_modifiers:
-            return f"{"".join(modifier_names)}{key_name}"
+            return MODIFIER_PREFIXES[self.modifier.mask()] + key_name
 
-        return f"{key_name}"
+        return key_name
 
     def __repr__(self) -> str:
         return f"""
@@ -229,6 +257,78 @@ class IOKeycode:
     def __str__(self) -> str:
         return self.__repr__()
 
+@dataclass(slots=True)
+class IOPaste:
+    """
+    # IOPaste
+    @dataclass(slots=True)
+
+    A whole bracketed paste, delivered as one event.
+
+    Parameters:
+
+        (*) text                    The pasted text
+                                    @Type: str
+    """
+
+    text: str
+
+@dataclass(slots=True)
+class IOMouseEvent:
+    """
+    # IOMouseEvent
+    @dataclass(slots=True)
+
+    A mouse report (xterm SGR, mode 1006).
+
+    Parameters:
+
+        (*) action                  What happened
+                                    @Type: IOMouseAction (Enum)
+
+        (*) button                  0 left, 1 middle, 2 right, 3 none
+                                    (motion without a button), 4-7 wheel
+                                    up, down, left, right, 8+ extra buttons
+                                    @Type: int
+
+        (*) x, y                    Cell position, 1-based
+                                    @Type: int
+
+        (*) modifier                Modifiers held
+                                    @Type: IOModifiers
+
+        (*) count                   Number of reports merged into this one
+                                    (wheel bursts)
+                                    @Type: int
+    """
+
+    action: IOMouseAction
+    button: int
+    x: int
+    y: int
+    modifier: IOModifiers
+    count: int = 1
+
+@dataclass(slots=True)
+class IOResize:
+    """
+    # IOResize
+    @dataclass(slots=True)
+
+    The terminal was resized. A burst of resizes (a window being dragged)
+    is reported once, with the final size.
+
+    Parameters:
+
+        (*) width, height           New size in cells
+                                    @Type: int
+    """
+
+    width: int
+    height: int
+
+IOEvent = Union[IOKeycode, IOPaste, IOMouseEvent, IOResize]
+
 # MARK: Functions
 def parse_keycode(input: str, escape_sequence = "<esc>") -> IOKeycode:
     """
@@ -267,18 +367,18 @@ def parse_keycode(input: str, escape_sequence = "<esc>") -> IOKeycode:
     was_terminated = False
 
     if not input:
-        return IOKeycode(-1, "", IOModifiers(), IOTerminalStandard.UNKNOWN, IOEscape.NONE, False, escape_sequence, was_terminated)
+        return IOKeycode(-1, "", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.NONE, False, escape_sequence, was_terminated)
 
     if input.startswith(escape_sequence):
 
         if len(input) == escape_len or input[escape_len:escape_len + escape_len] == escape_sequence:
             was_terminated = True
-            return IOKeycode(-1, "", IOModifiers(), IOTerminalStandard.UNKNOWN, IOEscape.ESC, False, escape_sequence, was_terminated)
+            return IOKeycode(-1, "", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ESC, False, escape_sequence, was_terminated)
 
         if input[escape_len] == '[':
             if len(input) == escape_len + 1:
                 was_terminated = True
-                return IOKeycode(-1, "", IOModifiers(), IOTerminalStandard.UNKNOWN, IOEscape.ALT_BRACKET, False, escape_sequence, was_terminated)
+                return IOKeycode(-1, "", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ALT_BRACKET, False, escape_sequence, was_terminated)
 
             if input.endswith('~'):
                 was_terminated = True
@@ -305,26 +405,38 @@ def parse_keycode(input: str, escape_sequence = "<esc>") -> IOKeycode:
 
                 else: # This case is for when the escape sequence is not a known keycode, or has improper formatting.
                     was_terminated = False
-                    return IOKeycode(-1, "", IOModifiers(), IOTerminalStandard.UNKNOWN, IOEscape.INCOMPLETE, False, escape_sequence, was_terminated)
+                    return IOKeycode(-1, "", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.INCOMPLETE, False, escape_sequence, was_terminated)
 
         if len(input) == escape_len + 1 and input[escape_len] != '[':
             was_terminated = True
-            return IOKeycode(-1, input[escape_len], IOModifiers(), IOTerminalStandard.UNKNOWN, IOEscape.ALT_KEYPRESS, False, escape_sequence, was_terminated)
+            return IOKeycode(-1, input[escape_len], NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ALT_KEYPRESS, False, escape_sequence, was_terminated)
 
     was_terminated = True
-    return IOKeycode(-1, input[0], IOModifiers(), IOTerminalStandard.UNKNOWN, IOEscape.CHAR, False, escape_sequence, was_terminated)
+    return IOKeycode(-1, input[0], NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.CHAR, False, escape_sequence, was_terminated)
+
+class UnicodeEscapeTable(dict):
+    # str.translate table producing the same text as encode('unicode_escape'),
+    # filled on demand so every character is only escaped once.
+    def __missing__(self, point: int) -> str:
+        char = chr(point)
+        if 0x20 <= point < 0x7f and char != "\\":
+            escaped = char
+        else:
+            escaped = char.encode("unicode_escape").decode("ascii")
+        self[point] = escaped
+        return escaped
+
+UNICODE_ESCAPE_TABLE = UnicodeEscapeTable()
 
 def escape_escape(escape: str, escape_sequence: str, escape_char_raw: str) -> str:
-    return escape.encode('unicode_escape').decode('utf-8').replace(escape_char_raw, escape_sequence)
+    # Compatibility adapter for the textual "<esc>" form. The byte path
+    # (IOKeyDecoder, CONTROL_KEYS) does not need it.
+    if escape.isascii() and escape.isprintable() and "\\" not in escape:
+        return escape
+    return escape.translate(UNICODE_ESCAPE_TABLE).replace(escape_char_raw, escape_sequence)
 
 def calculate_modifier(modifier: int) -> IOModifiers:
-    modifier -= 1
-    return IOModifiers(
-        SHIFT=(modifier & 1) != 0,
-        ALT=(modifier & 2) != 0,
-        CTRL=(modifier & 4) != 0,
-        META=(modifier & 8) != 0,
-    )
+    return MODIFIERS[(modifier - 1) & 15]
 def parse_extra_key(input: str) -> str:
     """
     # parse_extra_key(input: str) -> str
@@ -332,7 +444,9 @@ def parse_extra_key(input: str) -> str:
 
     Parameters:
         (*) input:              The input string to parse
-                                the extra key from.
+                                the extra key from, raw or in
+                                the textual form produced by
+                                escape_escape.
                                 @Type str;
 
     Return Value:
@@ -344,27 +458,353 @@ def parse_extra_key(input: str) -> str:
                 (*) <tab>
                 (*) <enter>
                 (*) <ctrl-c>
+
+            Raw control bytes ("\r", "\x7f", ...) are named too, not
+            only their escaped form.
     """
 
-    encoded_input = input.encode('unicode_escape').decode('utf-8')
-
-    if encoded_input.startswith("\\\\r"):
-        return "<enter>"
-    if encoded_input.startswith("\\\\n"):
-        return "<enter>"
-    if encoded_input.startswith("\\\\t"):
-        return "<tab>"
-    if encoded_input.startswith("\\\\b"):
-        return "<backspace>"
-    if encoded_input.startswith("\\\\x7f"):
-        return "<backspace>"
-    if encoded_input.startswith("\\\\x08"):
-        return "<backspace>"
-    if encoded_input.startswith("\\\\x09"):
-        return "<tab>"
-    if encoded_input.startswith("\\\\x0D"):
-        return "<enter>"
-    if encoded_input.startswith("\\\\x03"):
-        return "<ctrl+c>"
+    if not input:
+        return ""
+
+    # Raw input, one table lookup
+    point = ord(input[0])
+    if point < 256 and CONTROL_KEYS[point]:
+        return CONTROL_KEYS[point]
+
+    # Textual form from escape_escape
+    if input[0] == "\\":
+        for escaped, name in ESCAPED_CONTROL_KEYS:
+            if input.startswith(escaped):
+                return name
+
+    return ""
 
+def parse_control_key(byte: int) -> str:
+    # Name of a single byte control key ("" if the byte is not one)
+    if 0 <= byte < 256:
+        return CONTROL_KEYS[byte]
     return ""
+
+def coalesce_mouse_event(events: List[Any], event: IOEvent) -> bool:
+    # Merges event into the last entry of events when both are motion
+    # reports (the latest position wins) or wheel reports (counts add up)
+    # of the same button and modifiers. False if it has to be appended.
+    if not events or not isinstance(event, IOMouseEvent):
+        return False
+
+    previous = events[-1]
+    if not (
+        isinstance(previous, IOMouseEvent)
+        and previous.action == event.action
+        and previous.button == event.button
+        and previous.modifier == event.modifier
+    ):
+        return False
+
+    if event.action == IOMouseAction.MOVE or event.action == IOMouseAction.DRAG:
+        events[-1] = event
+        return True
+    if event.action == IOMouseAction.WHEEL:
+        events[-1] = IOMouseEvent(event.action, event.button, event.x, event.y, event.modifier, previous.count + event.count)
+        return True
+    return False
+
+def coalesce_mouse_events(events: List[Any]) -> List[Any]:
+    """
+    # coalesce_mouse_events(events: List[Any]) -> List[Any]
+    Merge runs of motion and wheel reports in a batch of input, e.g. what
+    piled up in an input queue over several reads. Other items are kept
+    as they are, in order.
+
+    Return Value:
+
+        (*) The batch with every run merged into its last report
+            @Type List[Any]
+    """
+
+    merged: List[Any] = []
+    for event in events:
+        if not coalesce_mouse_event(merged, event):
+            merged.append(event)
+    return merged
+
+@dataclass
+class IOKeyDecoder:
+    """
+    # IOKeyDecoder
+    @dataclass
+
+    Incremental, table driven decoder for terminal input. Bytes are fed in
+    chunks of any size, every byte is looked at once, and complete key
+    events (IOKeycode) come out. A sequence cut by the end of a chunk is
+    completed by the next chunk, nothing is ever scanned again.
+
+    Bracketed pastes are collected in bulk (one search for the end marker
+    per chunk) and come out as a single IOPaste event.
+
+    A lone ESC is ambiguous: it may be the Escape key, or the start of a
+    sequence whose rest has not been read yet. It is held for at most
+    escape_timeout seconds; the reader waits on its fd until timeout()
+    and then calls expire(), so no sleeping or extra key press is needed.
+    Sequences that arrive together are decoded immediately.
+
+    SGR mouse reports come out as IOMouseEvent. With coalesce_motion, a
+    motion report replaces the motion report right before it, and a wheel
+    report is merged into the one before it (count), so a burst read in
+    one chunk only yields its latest position. Bursts spread over several
+    reads are merged by the consumer, see coalesce_mouse_events.
+
+    With key_sequences (Terminfo.key_sequences()), sequences listed by the
+    terminal's terminfo entry are looked up first and come out with
+    IOTerminalStandard.TERMINFO and the key name as keycode_char. Other
+    sequences are decoded as XTERM / VT.
+
+    The events match what parse_keycode returns for the same keys, except
+    that character events carry their code point as keycode.
+
+    Parameters:
+
+        (*) escape_sequence         Textual escape used in the events
+                                    @Type: str
+                                    @Default: "<esc>"
+
+        (*) coalesce_motion         Merge consecutive motion and wheel
+                                    reports
+                                    @Type: bool
+                                    @Default: True
+
+        (*) escape_timeout          Seconds an incomplete escape sequence
+                                    is held
+                                    @Type: float
+                                    @Default: ESCAPE_TIMEOUT
+
+        (*) key_sequences           Key sequences without the leading ESC,
+                                    with key name and modifier mask
+                                    @Type: Dict[bytes, Tuple[str, int]]
+                                    @Default: {}
+
+    Methods:
+
+        (*) feed                    Decode a chunk of input
+                                    @return List[IOEvent]
+
+        (*) flush                   Resolve a pending, incomplete sequence
+                                    (a lone ESC becomes an ESC event)
+                                    @return List[IOEvent]
+
+        (*) is_pending              Whether an incomplete sequence is held
+                                    @return bool
+
+        (*) timeout                 Seconds until the held sequence
+                                    expires, None if nothing is held
+                                    @return Optional[float]
+
+        (*) expire                  flush, once the held sequence is due
+                                    @return List[IOEvent]
+    """
+
+    escape_sequence: str = ESCAPE_SEQUENCE
+    coalesce_motion: bool = True
+    escape_timeout: float = ESCAPE_TIMEOUT
+    pending_since: Optional[float] = None
+    key_sequences: Dict[bytes, Tuple[str, int]] = field(default_factory=dict)
+    state: int = STATE_GROUND
+    parameters: bytearray = field(default_factory=bytearray)
+    paste: bytearray = field(default_factory=bytearray)
+    text_decoder: Any = field(default_factory=lambda: codecs.getincrementaldecoder("utf-8")(errors="replace"))
+
+    def is_pending(self) -> bool:
+        return self.state != STATE_GROUND
+
+    def timeout(self, now: Optional[float] = None) -> Optional[float]:
+        if self.pending_since is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.pending_since + self.escape_timeout - now)
+
+    def expire(self, now: Optional[float] = None) -> List[IOEvent]:
+        remaining = self.timeout(now)
+        if remaining is None or remaining > 0:
+            return []
+        return self.flush()
+
+    def feed(self, data: bytes) -> List[IOEvent]:
+        events: List[IOEvent] = []
+        index = 0
+        length = len(data)
+
+        while index < length:
+            byte = data[index]
+            state = self.state
+
+            if state == STATE_GROUND:
+                if byte == 0x1b:
+                    self.state = STATE_ESCAPE
+                    index += 1
+                elif byte < 0x20 or byte == 0x7f:
+                    events.append(self._char_event(chr(byte)))
+                    index += 1
+                else:
+                    # Decode the whole run of text at once, a multibyte
+                    # character cut by the chunk end is kept by the decoder.
+                    end = TEXT_RUN.match(data, index).end()
+                    for char in self.text_decoder.decode(data[index:end]):
+                        events.append(self._char_event(char))
+                    index = end
+
+            elif state == STATE_ESCAPE:
+                index += 1
+                if byte == 0x5b:  # [
+                    self.state = STATE_CSI
+                    self.parameters.clear()
+                elif byte == 0x4f:  # O
+                    self.state = STATE_SS3
+                elif byte == 0x1b:
+                    # ESC ESC, the first one was a lone escape
+                    events.append(self._event(-1, "", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ESC, False))
+                elif byte < 0x80:
+                    events.append(self._event(-1, chr(byte), NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ALT_KEYPRESS, False))
+                    self.state = STATE_GROUND
+                else:
+                    # Not a sequence, the escape stands alone
+                    events.append(self._event(-1, "", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ESC, False))
+                    self.state = STATE_GROUND
+                    index -= 1
+
+            elif state == STATE_CSI:
+                index += 1
+                if 0x20 <= byte <= 0x3f or (byte == 0x5b and not self.parameters):
+                    # Parameter and intermediate bytes, and the second [ of
+                    # the Linux console function keys (ESC [ [ A)
+                    if len(self.parameters) < MAX_CSI_LENGTH:
+                        self.parameters.append(byte)
+
+                    # Some terminals end keys on an intermediate byte
+                    # (rxvt ESC [ 2 $), only terminfo knows them
+                    if byte <= 0x2f and self.key_sequences:
+                        key = self.key_sequences.get(b"[" + self.parameters)
+                        if key is not None:
+                            events.append(self._terminfo_event(key))
+                            self.state = STATE_GROUND
+                elif byte == 0x7e and self.parameters == PASTE_START_PARAMETERS:
+                    self.state = STATE_PASTE
+                    self.paste.clear()
+                elif (byte == 0x4d or byte == 0x6d) and self.parameters[:1] == b"<":
+                    self._mouse_event(events, bytes(self.parameters), byte)
+                    self.state = STATE_GROUND
+                elif 0x40 <= byte <= 0x7e:
+                    events.append(self._csi_event(bytes(self.parameters), byte))
+                    self.state = STATE_GROUND
+                else:
+                    # Broken sequence, drop it and read the byte normally
+                    self.state = STATE_GROUND
+                    index -= 1
+
+            elif state == STATE_PASTE:
+                # The end marker may straddle chunks, so search from just
+                # before the bytes added now.
+                search_from = max(0, len(self.paste) - len(PASTE_END) + 1)
+                self.paste += data[index:] if index else data
+                end = self.paste.find(PASTE_END, search_from)
+
+                if end == -1:
+                    break
+
+                # Continue with whatever followed the marker in this chunk
+                index = length - (len(self.paste) - end - len(PASTE_END))
+                events.append(IOPaste(self.paste[:end].decode("utf-8", errors="replace")))
+                self.paste.clear()
+                self.state = STATE_GROUND
+
+            else:  # STATE_SS3
+                index += 1
+                key = self.key_sequences.get(bytes((0x4f, byte))) if self.key_sequences else None
+                if key is not None:
+                    events.append(self._terminfo_event(key))
+                    self.state = STATE_GROUND
+                    continue
+                events.append(self._event(-1, chr(byte), NO_MODIFIERS, IOTerminalStandard.XTERM, IOEscape.KEYCODE_SEQUENCE, False))
+                self.state = STATE_GROUND
+
+        # Start the clock when a sequence is left incomplete, pastes are
+        # closed by their end marker and never expire
+        if self.state == STATE_GROUND or self.state == STATE_PASTE:
+            self.pending_since = None
+        elif self.pending_since is None:
+            self.pending_since = time.monotonic()
+
+        return events
+
+    def flush(self) -> List[IOEvent]:
+        state = self.state
+        if state == STATE_PASTE:
+            return []
+
+        self.state = STATE_GROUND
+        self.pending_since = None
+
+        if state == STATE_ESCAPE:
+            return [self._event(-1, "", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ESC, False)]
+        if state == STATE_SS3:
+            return [self._event(-1, "O", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ALT_KEYPRESS, False)]
+        if state == STATE_CSI and not self.parameters:
+            return [self._event(-1, "", NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.ALT_BRACKET, False)]
+        return []
+
+    def _event(self, keycode: int, keycode_char: str, modifier: IOModifiers, terminal: IOTerminalStandard, escape_type: IOEscape, has_modifier_extra: bool) -> IOKeycode:
+        return IOKeycode(keycode, keycode_char, modifier, terminal, escape_type, has_modifier_extra, self.escape_sequence, True)
+
+    def _terminfo_event(self, key: Tuple[str, int]) -> IOKeycode:
+        name, mask = key
+        return self._event(-1, name, MODIFIERS[mask], IOTerminalStandard.TERMINFO, IOEscape.KEYCODE_SEQUENCE, mask != 0)
+
+    def _char_event(self, char: str) -> IOKeycode:
+        return self._event(ord(char), char, NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.CHAR, False)
+
+    def _mouse_event(self, events: List[IOEvent], parameters: bytes, final: int):
+        # ESC [ < button ; x ; y M (press / motion) or m (release)
+        fields = parameters[1:].split(b";")
+        if len(fields) != 3 or not all(f.isdigit() for f in fields):
+            return
+
+        code, x, y = (int(f) for f in fields)
+        # Modifier bits: shift 4, meta 8, ctrl 16
+        modifier = MODIFIERS[(code >> 2) & 1 | (code >> 2) & 2 | (code >> 2) & 4]
+        button = code & 3 | (code & 128) >> 4
+
+        if code & 64:
+            action = IOMouseAction.WHEEL
+            button += 4
+        elif code & 32:
+            action = IOMouseAction.MOVE if code & 3 == 3 else IOMouseAction.DRAG
+        elif final == 0x6d:
+            action = IOMouseAction.RELEASE
+        else:
+            action = IOMouseAction.PRESS
+
+        event = IOMouseEvent(action, button, x, y, modifier)
+        if not (self.coalesce_motion and coalesce_mouse_event(events, event)):
+            events.append(event)
+
+    def _csi_event(self, parameters: bytes, final: int) -> IOKeycode:
+        if self.key_sequences:
+            key = self.key_sequences.get(b"[" + parameters + bytes((final,)))
+            if key is not None:
+                return self._terminfo_event(key)
+
+        fields = parameters.split(b";") if parameters else []
+
+        if all(f.isdigit() for f in fields):
+            numbers = [int(f) for f in fields]
+
+            # VT: ESC [ keycode (; modifier) ~
+            if final == 0x7e and 1 <= len(numbers) <= 2:
+                modifier = numbers[1] if len(numbers) == 2 else 1
+                return self._event(numbers[0], str(numbers[0]), calculate_modifier(modifier), IOTerminalStandard.VT, IOEscape.KEYCODE_SEQUENCE, len(numbers) == 2)
+
+            # XTERM: ESC [ (1 ;) (modifier) letter
+            if chr(final).isalpha() and len(numbers) <= 2:
+                modifier = numbers[-1] if numbers else 1
+                return self._event(-1, chr(final), calculate_modifier(modifier), IOTerminalStandard.XTERM, IOEscape.KEYCODE_SEQUENCE, bool(numbers))
+
+        return self._event(-1, chr(final), NO_MODIFIERS, IOTerminalStandard.UNKNOWN, IOEscape.KEYCODE_SEQUENCE, False)
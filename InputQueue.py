@@ -0,0 +1,161 @@
+#
+# INPUTQUEUE - BOUNDED INPUT EVENT QUEUE
+# Hands input from the reader thread to whoever consumes it, in batches.
+# The queue has a fixed capacity, what happens when it is full is set by
+# its overflow policy.
+#
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from typing import Any, Deque, List, Optional
+
+# MARK: Constants
+INPUT_QUEUE_CAPACITY = 1024
+
+# MARK: Enums
+class OverflowPolicy(Enum):
+    BLOCK = auto()          # wait for room, the reader stops reading
+    DROP_OLDEST = auto()    # make room by dropping the oldest item
+    DROP_NEWEST = auto()    # refuse the new item
+
+# MARK: Classes
+@dataclass
+class InputQueue:
+    """
+    # InputQueue
+    @dataclass
+
+    Bounded FIFO between one producer (the input reader) and consumers that
+    take everything queued at once with drain(). Thread safe.
+
+    Parameters:
+
+        (*) capacity                Most items held
+                                    @Type: int
+                                    @Default: INPUT_QUEUE_CAPACITY
+
+        (*) policy                  What put does when the queue is full.
+                                    BLOCK loses nothing: a blocked reader
+                                    leaves input in the tty, and the
+                                    terminal waits in turn. The DROP
+                                    policies suit input that may be lost.
+                                    @Type: OverflowPolicy (Enum)
+                                    @Default: OverflowPolicy.BLOCK
+
+        (*) block_timeout           Longest BLOCK wait in seconds, the item
+                                    is dropped after it. None waits until
+                                    there is room or the queue is closed.
+                                    @Type: Optional[float]
+                                    @Default: None
+
+    Metrics:
+
+        (*) depth                   Items queued now
+        (*) max_depth               Most items ever queued at once
+        (*) enqueued, dequeued      Items put and taken
+        (*) dropped                 Items lost to the overflow policy
+
+    Methods:
+
+        (*) put                     Queue an item, False if it was dropped
+                                    @return bool
+
+        (*) put_many                Queue items in order
+                                    @return int (items dropped)
+
+        (*) drain                   Take up to max_items, waiting up to
+                                    timeout seconds for the first one
+                                    @return List[Any]
+
+        (*) close / reopen          Wake and refuse blocked producers,
+                                    accept items again
+    """
+
+    capacity: int = INPUT_QUEUE_CAPACITY
+    policy: OverflowPolicy = OverflowPolicy.BLOCK
+    block_timeout: Optional[float] = None
+    items: Deque[Any] = field(init=False, default_factory=deque)
+    condition: threading.Condition = field(init=False, default_factory=threading.Condition)
+    closed: bool = field(init=False, default=False)
+    max_depth: int = field(init=False, default=0)
+    enqueued: int = field(init=False, default=0)
+    dequeued: int = field(init=False, default=0)
+    dropped: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        if self.capacity < 1:
+            raise ValueError("InputQueue capacity must be at least 1")
+
+    @property
+    def depth(self) -> int:
+        return len(self.items)
+
+    def put(self, item: Any) -> bool:
+        with self.condition:
+            return self._put(item)
+
+    def put_many(self, items: List[Any]) -> int:
+        dropped = 0
+        with self.condition:
+            for item in items:
+                if not self._put(item):
+                    dropped += 1
+        return dropped
+
+    def drain(self, max_items: Optional[int] = None, timeout: float = 0) -> List[Any]:
+        with self.condition:
+            if not self.items and timeout > 0:
+                self.condition.wait_for(lambda: self.items or self.closed, timeout)
+
+            count = len(self.items) if max_items is None else min(max_items, len(self.items))
+            batch = [self.items.popleft() for _ in range(count)]
+            self.dequeued += count
+            if count:
+                # Room for blocked producers
+                self.condition.notify_all()
+            return batch
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def reopen(self):
+        with self.condition:
+            self.closed = False
+
+    def _put(self, item: Any) -> bool:
+        # Called with the condition held
+        if self.closed:
+            self.dropped += 1
+            return False
+
+        if len(self.items) >= self.capacity:
+            if self.policy == OverflowPolicy.DROP_NEWEST:
+                self.dropped += 1
+                return False
+
+            if self.policy == OverflowPolicy.BLOCK:
+                deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+                while len(self.items) >= self.capacity and not self.closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                if len(self.items) >= self.capacity or self.closed:
+                    self.dropped += 1
+                    return False
+            else:
+                self.items.popleft()
+                self.dropped += 1
+
+        self.items.append(item)
+        self.enqueued += 1
+        if len(self.items) > self.max_depth:
+            self.max_depth = len(self.items)
+        self.condition.notify_all()
+        return True
@@ -0,0 +1,256 @@
+#
+# LATENCY BENCHMARK
+# Runs the Termlink shell in a pseudo-terminal, replays scripted keystrokes
+# and measures the time from each keypress to the redraw that shows it.
+# Reports p50 / p99 input-to-paint latency and the shell's CPU use.
+# Usage: python LatencyBenchmark.py [scenario ...]
+#
+
+import os
+import pty
+import select
+import signal
+import struct
+import sys
+import termios
+import fcntl
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# MARK: Constants
+SHELL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Termlink.py")
+COLUMNS, ROWS = 80, 24
+STARTUP_TIMEOUT = 10.0
+# A key not painted after this long counts as lost
+PAINT_TIMEOUT = 2.0
+# The prompt line ends with the cursor, a reversed cell
+CURSOR = b"\x1b[7m"
+PASTE_START = b"\x1b[200~"
+PASTE_END = b"\x1b[201~"
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+# Pause between scenarios, seconds
+SETTLE_TIME = 0.2
+# Pending keys checked against each read, the rest waits for later reads
+MATCH_LOOKAHEAD = 64
+# Keep the prompt short, Enter clears it
+LINE_LENGTH = 40
+
+# MARK: Classes
+@dataclass
+class Keystroke:
+    # Bytes sent at `at` seconds into the scenario, painted once the output
+    # contains `marker`. No marker: not measured.
+    at: float
+    data: bytes
+    marker: Optional[bytes]
+
+@dataclass
+class Result:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    lost: int = 0
+    cpu: float = 0.0
+    wall: float = 0.0
+    output_bytes: int = 0
+
+def percentile(values: List[float], p: float) -> float:
+    # Nearest rank
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+# MARK: Scenarios
+def typing(rate: float, count: int, key: Optional[str] = None) -> Callable[[], List[Keystroke]]:
+    # count keys at rate keys/s. Every LINE_LENGTH keys Enter starts a new
+    # prompt (not measured).
+    def script() -> List[Keystroke]:
+        strokes: List[Keystroke] = []
+        line = ""
+        at = 0.0
+        for i in range(count):
+            if len(line) == LINE_LENGTH:
+                strokes.append(Keystroke(at, b"\r", None))
+                line = ""
+                at += 1 / rate
+            char = key or ALPHABET[i % len(ALPHABET)]
+            line += char
+            strokes.append(Keystroke(at, char.encode(), b"> " + line.encode() + CURSOR))
+            at += 1 / rate
+        return strokes
+    return script
+
+def paste(size: int, count: int, interval: float) -> Callable[[], List[Keystroke]]:
+    # count bracketed pastes of size characters, each ending in a unique
+    # tag, followed by Enter
+    def script() -> List[Keystroke]:
+        strokes: List[Keystroke] = []
+        at = 0.0
+        for i in range(count):
+            tag = f"end{i:04d}"
+            text = (ALPHABET * (size // len(ALPHABET) + 1))[:max(0, size - len(tag))] + tag
+            strokes.append(Keystroke(at, PASTE_START + text.encode() + PASTE_END, tag.encode() + CURSOR))
+            strokes.append(Keystroke(at + interval / 2, b"\r", None))
+            at += interval
+        return strokes
+    return script
+
+def idle(seconds: float) -> Callable[[], List[Keystroke]]:
+    # Nothing typed, measures the CPU the shell uses while waiting
+    def script() -> List[Keystroke]:
+        return [Keystroke(seconds, b"", None)]
+    return script
+
+SCENARIOS: Dict[str, Callable[[], List[Keystroke]]] = {
+    "idle": idle(2.0),
+    "typing": typing(rate=15, count=150),
+    "repeat": typing(rate=40, count=400, key="x"),
+    "burst": typing(rate=500, count=500),
+    "paste": paste(size=4096, count=20, interval=0.2),
+    "paste-large": paste(size=256 * 1024, count=3, interval=1.0),
+}
+
+# MARK: Harness
+def cpu_time(pid: int) -> float:
+    # User + system time of the process, from /proc (Linux)
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as file:
+            fields = file.read().rsplit(b")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+def start_shell() -> Tuple[int, int]:
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.environ.setdefault("TERM", "xterm-256color")
+        os.execv(sys.executable, [sys.executable, SHELL])
+
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", ROWS, COLUMNS, 0, 0))
+
+    # Wait for the first prompt
+    output = b""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while CURSOR not in output:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RuntimeError("The shell did not show a prompt")
+        if select.select([fd], [], [], remaining)[0]:
+            output += os.read(fd, 65536)
+    return pid, fd
+
+def settle(fd: int, seconds: float = SETTLE_TIME):
+    # Enter, so every scenario starts on an empty prompt, then let the
+    # shell go quiet
+    os.write(fd, b"\r")
+    deadline = time.monotonic() + seconds
+    while (remaining := deadline - time.monotonic()) > 0:
+        if select.select([fd], [], [], remaining)[0]:
+            os.read(fd, 1 << 16)
+
+def run(name: str, strokes: List[Keystroke], pid: int, fd: int) -> Result:
+    settle(fd)
+    result = Result(name)
+    pending: Deque[Tuple[float, bytes]] = deque()
+    outgoing = memoryview(b"")
+    tail = b""
+    index = 0
+
+    cpu_start = cpu_time(pid)
+    start = time.monotonic()
+    end = start + (strokes[-1].at if strokes else 0)
+
+    while True:
+        now = time.monotonic()
+
+        # Send what is due
+        while index < len(strokes) and start + strokes[index].at <= now and not outgoing:
+            stroke = strokes[index]
+            outgoing = memoryview(stroke.data)
+            if stroke.marker is not None:
+                pending.append((now, stroke.marker))
+            index += 1
+
+        # Keys never painted
+        while pending and now - pending[0][0] > PAINT_TIMEOUT:
+            pending.popleft()
+            result.lost += 1
+
+        if index == len(strokes) and not pending and not outgoing and now >= end:
+            break
+
+        timeout = 0.05
+        if index < len(strokes):
+            timeout = max(0.0, min(timeout, start + strokes[index].at - now))
+
+        readable, writable, _ = select.select([fd], [fd] if outgoing else [], [], timeout)
+
+        if writable:
+            outgoing = outgoing[os.write(fd, outgoing):]
+
+        if readable:
+            data = os.read(fd, 1 << 16)
+            painted = time.monotonic()
+            result.output_bytes += len(data)
+
+            # Markers may straddle reads, keep the end of the last one
+            window = tail + data
+            while pending:
+                # Keys handled in one batch are painted by one redraw, which
+                # only shows the last of them
+                found = next((i for i in range(min(len(pending), MATCH_LOOKAHEAD)) if pending[i][1] in window), -1)
+                if found < 0:
+                    break
+                for _ in range(found + 1):
+                    sent, marker = pending.popleft()
+                    result.latencies.append(painted - sent)
+                window = window[window.index(marker) + len(marker):]
+            tail = window[-max(len(m) for _, m in pending):] if pending else b""
+
+    result.wall = time.monotonic() - start
+    result.cpu = cpu_time(pid) - cpu_start
+    return result
+
+def report(result: Result):
+    ms = [latency * 1000 for latency in result.latencies]
+    cpu = result.cpu / result.wall * 100 if result.wall else 0.0
+    if ms:
+        print(
+            f"{result.name:<12} {len(ms):>6} keys  p50 {percentile(ms, 50):>8.2f} ms  p99 {percentile(ms, 99):>8.2f} ms  "
+            f"max {max(ms):>8.2f} ms  lost {result.lost:>4}  cpu {cpu:>6.1f}%  out {result.output_bytes / result.wall / 1024:>9,.0f} KiB/s"
+        )
+    else:
+        print(f"{result.name:<12} {'-':>6} keys  {'':>44}lost {result.lost:>4}  cpu {cpu:>6.1f}%  out {result.output_bytes / result.wall / 1024:>9,.0f} KiB/s")
+
+def main():
+    names = sys.argv[1:] or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenario(s) {', '.join(unknown)}, choose from {', '.join(SCENARIOS)}")
+
+    pid, fd = start_shell()
+    try:
+        for name in names:
+            report(run(name, SCENARIOS[name](), pid, fd))
+    finally:
+        # Ctrl+C ends the shell
+        try:
+            os.write(fd, b"\x03")
+            deadline = time.monotonic() + 2
+            while time.monotonic() < deadline:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    break
+                if select.select([fd], [], [], 0.05)[0]:
+                    os.read(fd, 1 << 16)
+            else:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+        except OSError:
+            pass
+        os.close(fd)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#
+# OUTPUTBUILDER - OPTIMIZING FRAME OUTPUT
+# Collects drawing commands for a frame and turns them into the smallest
+# byte sequence that produces the same screen.
+#
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import CtrlBytes
+from CellField import CellField
+from Terminfo import Terminfo
+from TextWidth import display_width
+
+# MARK: Constants
+MOVE = 0
+STYLE = 1
+TEXT = 2
+
+@dataclass
+class OutputBuilder:
+    """
+    # OutputBuilder
+    Buffers move, style and text commands, and encodes them with CtrlBytes
+    when the frame is built:
+
+        (*) moves to where the cursor already is are dropped, consecutive
+            moves only keep the last one
+        (*) the shortest of absolute (CUP), relative (CUU/CUD/CUF/CUB),
+            carriage return + relative and backspace motion is used
+        (*) consecutive style changes are merged, and a style that is
+            already active is not emitted again
+
+    The cursor and style the terminal is left with are remembered across
+    frames. Call invalidate() if something else writes to the terminal.
+
+    Properties:
+
+        (*) columns     Terminal width, used to notice when text reaches
+                        the right margin. 0 if unknown, then the cursor
+                        position is forgotten after every text and the
+                        next move is absolute; give it (e.g. from
+                        E330.get_size()) for relative motion.
+                        @Type: int
+                        @Default: 0
+
+        (*) row, col    Cursor position (1-based), 0 if unknown.
+                        @Type: int
+
+        (*) style       Active style, None if unknown.
+                        @Type: Optional[str]
+
+        (*) terminfo    Capabilities of the terminal. Its cursor motion
+                        and sgr0 are used where it has them, the xterm
+                        sequences otherwise.
+                        @Type: Optional[Terminfo]
+                        @Default: None
+
+    Styles are full descriptions of the wanted attributes, like the output
+    of CellProperties.render(). A style change is emitted as a reset
+    followed by the style, and "" is the default style.
+    """
+
+    columns: int = 0
+    row: int = 0
+    col: int = 0
+    style: Optional[str] = None
+    terminfo: Optional[Terminfo] = None
+    commands: List[Tuple[int, Any, Any]] = field(default_factory=list)
+    encoded_styles: Dict[str, bytes] = field(default_factory=dict, repr=False)
+
+    # MARK: Commands
+    def move_to(self, row: int, col: int) -> "OutputBuilder":
+        self.commands.append((MOVE, row, col))
+        return self
+
+    def set_style(self, style: str) -> "OutputBuilder":
+        self.commands.append((STYLE, style, None))
+        return self
+
+    def text(self, text: str) -> "OutputBuilder":
+        if text:
+            self.commands.append((TEXT, text, None))
+        return self
+
+    def draw_field(self, f: CellField, row: int = 1, col: int = 1) -> "OutputBuilder":
+        if f.field is None:
+            return self
+
+        # Cells share their properties, so render each properties object once
+        rendered: Dict[int, str] = {}
+
+        for y in range(f.height):
+            self.move_to(row + y, col)
+            for x in range(f.width):
+                cell = f.field.at(x, y)
+
+                if cell is None:
+                    self.move_to(row + y, col + x + 1)
+                    continue
+
+                # The second column of a wide character
+                if cell.character == "":
+                    continue
+
+                style = rendered.get(id(cell.properties))
+                if style is None:
+                    style = cell.properties.render()
+                    rendered[id(cell.properties)] = style
+
+                self.set_style(style)
+                self.text(cell.character)
+
+        return self
+
+    def invalidate(self):
+        self.row = 0
+        self.col = 0
+        self.style = None
+
+    # MARK: Encoding
+    def build(self) -> bytes:
+        buffer = bytearray()
+        pending_move: Optional[Tuple[int, int]] = None
+        pending_style: Optional[str] = None
+
+        for kind, a, b in self.commands:
+            if kind == MOVE:
+                pending_move = (a, b)
+                continue
+
+            if kind == STYLE:
+                pending_style = a
+                continue
+
+            if pending_move is not None:
+                self._move(buffer, *pending_move)
+                pending_move = None
+
+            if pending_style is not None:
+                self._style(buffer, pending_style)
+                pending_style = None
+
+            buffer += a.encode("utf-8")
+            self._advance(a)
+
+        if pending_move is not None:
+            self._move(buffer, *pending_move)
+        if pending_style is not None:
+            self._style(buffer, pending_style)
+
+        self.commands.clear()
+        return bytes(buffer)
+
+    def _advance(self, text: str):
+        if self.row == 0:
+            return
+
+        # Control characters move the cursor in ways not tracked here
+        if not text.isprintable():
+            self.invalidate()
+            return
+
+        self.col += display_width(text)
+        if not self.columns:
+            # Text may have reached the right margin, leaving the cursor
+            # waiting to wrap (or wrapped), so the next move is absolute
+            self.row = 0
+            self.col = 0
+        elif self.col > self.columns:
+            self.invalidate()
+
+    def _style(self, buffer: bytearray, style: str):
+        if style == self.style:
+            return
+
+        encoded = self.encoded_styles.get(style)
+        if encoded is None:
+            reset = self.terminfo.string("sgr0") if self.terminfo is not None else None
+            encoded = (reset or CtrlBytes.RESET) + style.encode("utf-8")
+            self.encoded_styles[style] = encoded
+
+        buffer += encoded
+        self.style = style
+
+    def _move(self, buffer: bytearray, row: int, col: int):
+        if (row, col) == (self.row, self.col):
+            return
+
+        best = self._absolute_motion(row, col)
+
+        if self.row != 0:
+            vertical = self._vertical_motion(row - self.row)
+
+            relative = vertical + self._horizontal_motion(col - self.col)
+            if len(relative) < len(best):
+                best = relative
+
+            carriage_return = b"\r" + vertical + self._horizontal_motion(col - 1)
+            if len(carriage_return) < len(best):
+                best = carriage_return
+
+        buffer += best
+        self.row = row
+        self.col = col
+
+    def _absolute_motion(self, row: int, col: int) -> bytes:
+        if self.terminfo is not None:
+            sequence = self.terminfo.tparm("cup", row - 1, col - 1)
+            if sequence is not None:
+                return sequence
+        if row == 1 and col == 1:
+            return CtrlBytes.CURSOR_HOME
+        if col == 1:
+            return CtrlBytes.CSI + CtrlBytes.number(row) + b"H"
+        buffer = bytearray()
+        CtrlBytes.put_cursor_position(buffer, row, col)
+        return bytes(buffer)
+
+    def _vertical_motion(self, n: int) -> bytes:
+        if n == 0:
+            return b""
+        if self.terminfo is not None:
+            sequence = self._terminfo_motion("cud", "cud1", n) if n > 0 else self._terminfo_motion("cuu", "cuu1", -n)
+            if sequence is not None:
+                return sequence
+        final = b"B" if n > 0 else b"A"
+        n = abs(n)
+        return CtrlBytes.CSI + final if n == 1 else CtrlBytes.CSI + CtrlBytes.number(n) + final
+
+    def _horizontal_motion(self, n: int) -> bytes:
+        if n == 0:
+            return b""
+        if self.terminfo is not None:
+            sequence = self._terminfo_motion("cuf", "cuf1", n) if n > 0 else self._terminfo_motion("cub", "cub1", -n)
+            if sequence is not None:
+                return sequence
+        if n > 0:
+            return CtrlBytes.CSI + b"C" if n == 1 else CtrlBytes.CSI + CtrlBytes.number(n) + b"C"
+        n = -n
+        # Backspaces are shorter than CUB for short distances
+        if n <= 3:
+            return b"\b" * n
+        return CtrlBytes.CSI + CtrlBytes.number(n) + b"D"
+
+    def _terminfo_motion(self, parametrized: str, single: str, n: int) -> Optional[bytes]:
+        # Shortest of the parametrized and the repeated single step motion
+        step = self.terminfo.string(single)
+        if step == b"\n":
+            # The tty may turn a newline into CR LF
+            step = None
+        sequence = self.terminfo.tparm(parametrized, n)
+        if step is not None and (sequence is None or len(step) * n <= len(sequence)):
+            return step * n
+        return sequence
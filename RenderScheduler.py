@@ -0,0 +1,138 @@
+#
+# RENDERSCHEDULER - FRAME RATE LIMITED REDRAWS
+# Collects redraw requests from anywhere and redraws at most once per frame
+# interval, only when something changed. Lowers the frame rate while the
+# terminal cannot keep up with the output.
+#
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import E330
+
+# MARK: Constants
+TARGET_FPS = 60.0
+# Slowest the scheduler degrades to
+MIN_FPS = 4.0
+# A frame whose write takes this share of the interval means the link is slow
+SLOW_WRITE_SHARE = 0.5
+# Interval growth when backed up, and recovery per smooth frame
+BACKOFF = 2.0
+RECOVERY = 0.8
+
+# MARK: Classes
+@dataclass
+class RenderScheduler:
+    """
+    # RenderScheduler
+    @dataclass
+
+    Calls render, inside one terminal frame, at most fps times per second
+    and only after invalidate(). Any number of invalidate() calls between
+    two frames cause one redraw.
+
+    While output backs up (the terminal fd would block, or writing a frame
+    takes more than SLOW_WRITE_SHARE of the interval), the interval grows
+    by BACKOFF, down to min_fps. It shrinks back by RECOVERY with every
+    frame that goes out smoothly.
+
+    Parameters:
+
+        (*) terminal                Terminal the frames are written to
+                                    @Type: E330
+
+        (*) render                  Draws the whole frame with
+                                    terminal.print / terminal.write
+                                    @Type: Callable[[], None]
+
+        (*) fps                     Target frame rate
+                                    @Type: float
+                                    @Default: TARGET_FPS
+
+        (*) min_fps                 Lowest frame rate when degraded
+                                    @Type: float
+                                    @Default: MIN_FPS
+
+    Metrics:
+
+        (*) frames                  Frames rendered
+        (*) coalesced               invalidate() calls merged into a frame
+                                    that was already due
+        (*) backed_up               Frames put off because the terminal
+                                    could not take output
+        (*) interval                Current frame interval, seconds
+
+    Methods:
+
+        (*) invalidate              Request a redraw, thread safe
+
+        (*) timeout                 Seconds until the next frame is due,
+                                    None if nothing is dirty
+                                    @return Optional[float]
+
+        (*) tick                    Render if a frame is due
+                                    @return bool (rendered)
+    """
+
+    terminal: "E330.E330"
+    render: Callable[[], None]
+    fps: float = TARGET_FPS
+    min_fps: float = MIN_FPS
+    dirty: bool = True
+    interval: float = field(init=False)
+    last_frame: float = field(init=False, default=0.0)
+    frames: int = field(init=False, default=0)
+    coalesced: int = field(init=False, default=0)
+    backed_up: int = field(init=False, default=0)
+    lock: threading.Lock = field(init=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        if self.fps <= 0 or self.min_fps <= 0:
+            raise ValueError("RenderScheduler frame rates must be positive")
+        self.interval = 1 / self.fps
+
+    def invalidate(self):
+        with self.lock:
+            if self.dirty:
+                self.coalesced += 1
+            self.dirty = True
+
+    def timeout(self, now: Optional[float] = None) -> Optional[float]:
+        if not self.dirty:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.last_frame + self.interval - now)
+
+    def tick(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+
+        with self.lock:
+            if not self.dirty or now < self.last_frame + self.interval:
+                return False
+
+            # The terminal is still busy with earlier output, drawing now
+            # would only queue more. Stay dirty and try again later.
+            if not self.terminal.output_writable():
+                self.backed_up += 1
+                self.last_frame = now
+                self._slow_down()
+                return False
+
+            self.dirty = False
+
+        with self.terminal.frame():
+            self.render()
+        elapsed = time.monotonic() - now
+
+        self.last_frame = now
+        self.frames += 1
+        if elapsed > self.interval * SLOW_WRITE_SHARE:
+            self._slow_down()
+        else:
+            self.interval = max(1 / self.fps, self.interval * RECOVERY)
+        return True
+
+    def _slow_down(self):
+        self.interval = min(1 / self.min_fps, self.interval * BACKOFF)
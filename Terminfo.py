@@ -0,0 +1,573 @@
+#
+# TERMINFO - COMPILED TERMINAL CAPABILITIES
+# Reads the compiled terminfo entry of a terminal straight from the local
+# database (no infocmp), and keeps the parsed tables in a disk cache keyed
+# by the entry's modification time.
+#
+
+import json
+import operator
+import os
+import re
+import struct
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# MARK: Constants
+MAGIC_LEGACY = 0o432    # 16-bit numbers
+MAGIC_32BIT = 0o1036    # 32-bit numbers (ncurses 6.1+)
+
+# Searched after $TERMINFO, ~/.terminfo and $TERMINFO_DIRS
+SYSTEM_DIRS = ("/etc/terminfo", "/lib/terminfo", "/usr/share/terminfo", "/usr/lib/terminfo", "/usr/share/lib/terminfo")
+
+# Bumped when the layout of the cache files changes
+CACHE_VERSION = 1
+
+# Padding, $<5> or $<2*/>, only real hardware terminals need it
+PADDING = re.compile(rb"\$<[0-9.]+[*/]*>")
+
+# MARK: Tables
+# Capability names in the order of the compiled tables
+BOOLEAN_NAMES: Tuple[str, ...] = (
+    "bw", "am", "xsb", "xhp", "xenl", "eo", "gn", "hc", "km", "hs", "in", "da",
+    "db", "mir", "msgr", "os", "eslok", "xt", "hz", "ul", "xon", "nxon", "mc5i",
+    "chts", "nrrmc", "npc", "ndscr", "ccc", "bce", "hls", "xhpa", "crxm",
+    "daisy", "xvpa", "sam", "cpix", "lpix", "OTbs", "OTns", "OTnc", "OTMT",
+    "OTNL", "OTpt", "OTxr"
+)
+
+NUMBER_NAMES: Tuple[str, ...] = (
+    "cols", "it", "lines", "lm", "xmc", "pb", "vt", "wsl", "nlab", "lh", "lw",
+    "ma", "wnum", "colors", "pairs", "ncv", "bufsz", "spinv", "spinh", "maddr",
+    "mjump", "mcs", "mls", "npins", "orc", "orl", "orhi", "orvi", "cps",
+    "widcs", "btns", "bitwin", "bitype", "OTug", "OTdC", "OTdN", "OTdB", "OTdT",
+    "OTkn"
+)
+
+STRING_NAMES: Tuple[str, ...] = (
+    "cbt", "bel", "cr", "csr", "tbc", "clear", "el", "ed", "hpa", "cmdch",
+    "cup", "cud1", "home", "civis", "cub1", "mrcup", "cnorm", "cuf1", "ll",
+    "cuu1", "cvvis", "dch1", "dl1", "dsl", "hd", "smacs", "blink", "bold",
+    "smcup", "smdc", "dim", "smir", "invis", "prot", "rev", "smso", "smul",
+    "ech", "rmacs", "sgr0", "rmcup", "rmdc", "rmir", "rmso", "rmul", "flash",
+    "ff", "fsl", "is1", "is2", "is3", "if", "ich1", "il1", "ip", "kbs", "ktbc",
+    "kclr", "kctab", "kdch1", "kdl1", "kcud1", "krmir", "kel", "ked", "kf0",
+    "kf1", "kf10", "kf2", "kf3", "kf4", "kf5", "kf6", "kf7", "kf8", "kf9",
+    "khome", "kich1", "kil1", "kcub1", "kll", "knp", "kpp", "kcuf1", "kind",
+    "kri", "khts", "kcuu1", "rmkx", "smkx", "lf0", "lf1", "lf10", "lf2", "lf3",
+    "lf4", "lf5", "lf6", "lf7", "lf8", "lf9", "rmm", "smm", "nel", "pad", "dch",
+    "dl", "cud", "ich", "indn", "il", "cub", "cuf", "rin", "cuu", "pfkey",
+    "pfloc", "pfx", "mc0", "mc4", "mc5", "rep", "rs1", "rs2", "rs3", "rf", "rc",
+    "vpa", "sc", "ind", "ri", "sgr", "hts", "wind", "ht", "tsl", "uc", "hu",
+    "iprog", "ka1", "ka3", "kb2", "kc1", "kc3", "mc5p", "rmp", "acsc", "pln",
+    "kcbt", "smxon", "rmxon", "smam", "rmam", "xonc", "xoffc", "enacs", "smln",
+    "rmln", "kbeg", "kcan", "kclo", "kcmd", "kcpy", "kcrt", "kend", "kent",
+    "kext", "kfnd", "khlp", "kmrk", "kmsg", "kmov", "knxt", "kopn", "kopt",
+    "kprv", "kprt", "krdo", "kref", "krfr", "krpl", "krst", "kres", "ksav",
+    "kspd", "kund", "kBEG", "kCAN", "kCMD", "kCPY", "kCRT", "kDC", "kDL",
+    "kslt", "kEND", "kEOL", "kEXT", "kFND", "kHLP", "kHOM", "kIC", "kLFT",
+    "kMSG", "kMOV", "kNXT", "kOPT", "kPRV", "kPRT", "kRDO", "kRPL", "kRIT",
+    "kRES", "kSAV", "kSPD", "kUND", "rfi", "kf11", "kf12", "kf13", "kf14",
+    "kf15", "kf16", "kf17", "kf18", "kf19", "kf20", "kf21", "kf22", "kf23",
+    "kf24", "kf25", "kf26", "kf27", "kf28", "kf29", "kf30", "kf31", "kf32",
+    "kf33", "kf34", "kf35", "kf36", "kf37", "kf38", "kf39", "kf40", "kf41",
+    "kf42", "kf43", "kf44", "kf45", "kf46", "kf47", "kf48", "kf49", "kf50",
+    "kf51", "kf52", "kf53", "kf54", "kf55", "kf56", "kf57", "kf58", "kf59",
+    "kf60", "kf61", "kf62", "kf63", "el1", "mgc", "smgl", "smgr", "fln", "sclk",
+    "dclk", "rmclk", "cwin", "wingo", "hup", "dial", "qdial", "tone", "pulse",
+    "hook", "pause", "wait", "u0", "u1", "u2", "u3", "u4", "u5", "u6", "u7",
+    "u8", "u9", "op", "oc", "initc", "initp", "scp", "setf", "setb", "cpi",
+    "lpi", "chr", "cvr", "defc", "swidm", "sdrfq", "sitm", "slm", "smicm",
+    "snlq", "snrmq", "sshm", "ssubm", "ssupm", "sum", "rwidm", "ritm", "rlm",
+    "rmicm", "rshm", "rsubm", "rsupm", "rum", "mhpa", "mcud1", "mcub1", "mcuf1",
+    "mvpa", "mcuu1", "porder", "mcud", "mcub", "mcuf", "mcuu", "scs", "smgb",
+    "smgbp", "smglp", "smgrp", "smgt", "smgtp", "sbim", "scsd", "rbim", "rcsd",
+    "subcs", "supcs", "docr", "zerom", "csnm", "kmous", "minfo", "reqmp",
+    "getm", "setaf", "setab", "pfxl", "devt", "csin", "s0ds", "s1ds", "s2ds",
+    "s3ds", "smglr", "smgtb", "birep", "binel", "bicr", "colornm", "defbi",
+    "endbi", "setcolor", "slines", "dispc", "smpch", "rmpch", "smsc", "rmsc",
+    "pctrm", "scesc", "scesa", "ehhlm", "elhlm", "elohlm", "erhlm", "ethlm",
+    "evhlm", "sgr1", "slength", "OTi2", "OTrs", "OTnl", "OTbc", "OTko", "OTma",
+    "OTG2", "OTG3", "OTG1", "OTG4", "OTGR", "OTGL", "OTGU", "OTGD", "OTGH",
+    "OTGV", "OTGC", "meml", "memu", "box1"
+)
+
+# Key names by capability, as IOKeycode.resolve_friendly_name spells them
+KEY_NAMES: Dict[str, str] = {
+    "kcuu1": "Up",
+    "kcud1": "Down",
+    "kcuf1": "Right",
+    "kcub1": "Left",
+    "khome": "Home",
+    "kend": "End",
+    "kich1": "Insert",
+    "kdch1": "Delete",
+    "kpp": "PgUp",
+    "knp": "PgDn",
+    "kb2": "Keypad 5",
+    **{f"kf{n}": f"F{n}" for n in range(64)},
+}
+
+# Shifted keys with a capability of their own
+SHIFTED_KEY_NAMES: Dict[str, str] = {
+    "kri": "Up",
+    "kind": "Down",
+    "kRIT": "Right",
+    "kLFT": "Left",
+    "kHOM": "Home",
+    "kEND": "End",
+    "kIC": "Insert",
+    "kDC": "Delete",
+    "kPRV": "PgUp",
+    "kNXT": "PgDn",
+    "kcbt": "Tab",
+}
+
+# Extended (ncurses) modified keys: kUP5 is Ctrl+Up, the digit is the
+# xterm modifier parameter
+EXTENDED_KEY_NAMES: Dict[str, str] = {
+    "kUP": "Up",
+    "kDN": "Down",
+    "kRIT": "Right",
+    "kLFT": "Left",
+    "kHOM": "Home",
+    "kEND": "End",
+    "kIC": "Insert",
+    "kDC": "Delete",
+    "kPRV": "PgUp",
+    "kNXT": "PgDn",
+}
+EXTENDED_KEY = re.compile(r"(k[A-Z]+)([2-8])?")
+
+# tparm operators taking two values, / and m truncate like C
+BINARY_OPERATORS: Dict[str, Callable[[int, int], int]] = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": lambda a, b: int(a / b) if b else 0,
+    "m": lambda a, b: a - b * int(a / b) if b else 0,
+    "&": operator.and_,
+    "|": operator.or_,
+    "^": operator.xor,
+    "=": lambda a, b: int(a == b),
+    "<": lambda a, b: int(a < b),
+    ">": lambda a, b: int(a > b),
+    "A": lambda a, b: int(bool(a and b)),
+    "O": lambda a, b: int(bool(a or b)),
+}
+
+# Parsed entries by terminal name, for this process
+terminfo_cache: Dict[str, "Terminfo"] = {}
+
+# MARK: Classes
+@dataclass
+class Terminfo:
+    """
+    # Terminfo
+    @dataclass
+
+    The capabilities of one terminal, from its compiled terminfo entry.
+
+    Properties:
+
+        (*) name                    Terminal name (first alias)
+                                    @Type: str
+
+        (*) aliases                 All names of the entry, the last one is
+                                    the description
+                                    @Type: List[str]
+
+        (*) booleans                Boolean capabilities that are set
+                                    @Type: Dict[str, bool]
+
+        (*) numbers                 Numeric capabilities
+                                    @Type: Dict[str, int]
+
+        (*) strings                 String capabilities, raw
+                                    @Type: Dict[str, bytes]
+
+    Methods:
+
+        (*) flag                    Boolean capability (tigetflag)
+                                    @return bool
+
+        (*) number                  Numeric capability, -1 if absent
+                                    (tigetnum)
+                                    @return int
+
+        (*) string                  String capability, None if absent
+                                    (tigetstr)
+                                    @return Optional[bytes]
+
+        (*) tparm                   String capability with its parameters
+                                    applied, None if absent. Results are
+                                    cached.
+                                    @return Optional[bytes]
+
+        (*) key_sequences           Sequences the keyboard sends, without
+                                    the leading ESC, with key name and
+                                    modifier mask
+                                    @return Dict[bytes, Tuple[str, int]]
+    """
+
+    name: str
+    aliases: List[str] = field(default_factory=list)
+    booleans: Dict[str, bool] = field(default_factory=dict)
+    numbers: Dict[str, int] = field(default_factory=dict)
+    strings: Dict[str, bytes] = field(default_factory=dict)
+    tparm_cache: Dict[Tuple[Any, ...], Optional[bytes]] = field(default_factory=dict, repr=False)
+
+    def flag(self, name: str) -> bool:
+        return self.booleans.get(name, False)
+
+    def number(self, name: str) -> int:
+        return self.numbers.get(name, -1)
+
+    def string(self, name: str) -> Optional[bytes]:
+        return self.strings.get(name)
+
+    def tparm(self, name: str, *parameters: int) -> Optional[bytes]:
+        key = (name, *parameters)
+        try:
+            return self.tparm_cache[key]
+        except KeyError:
+            pass
+
+        capability = self.strings.get(name)
+        result = None if capability is None else tparm(capability, *parameters)
+        self.tparm_cache[key] = result
+        return result
+
+    def key_sequences(self) -> Dict[bytes, Tuple[str, int]]:
+        sequences: Dict[bytes, Tuple[str, int]] = {}
+
+        for capability, sequence in self.strings.items():
+            # Single bytes (kbs, kent) are control keys, handled as such
+            if len(sequence) < 2 or sequence[0] != 0x1b:
+                continue
+
+            if capability in KEY_NAMES:
+                key = (KEY_NAMES[capability], 0)
+            elif capability in SHIFTED_KEY_NAMES:
+                key = (SHIFTED_KEY_NAMES[capability], 1)
+            else:
+                match = EXTENDED_KEY.fullmatch(capability)
+                if match is None or match.group(1) not in EXTENDED_KEY_NAMES:
+                    continue
+                parameter = int(match.group(2)) if match.group(2) else 2
+                key = (EXTENDED_KEY_NAMES[match.group(1)], parameter - 1)
+
+            # The first capability wins, like the kf13 / Shift+F1 aliases
+            sequences.setdefault(sequence[1:], key)
+
+        return sequences
+
+# MARK: Parsing
+def parse_terminfo(data: bytes) -> Terminfo:
+    """
+    # parse_terminfo(data: bytes) -> Terminfo
+    Parse a compiled terminfo entry (term(5)), including the ncurses
+    extended capabilities. Raises ValueError if data is not one.
+    """
+
+    if len(data) < 12:
+        raise ValueError("Not a compiled terminfo entry")
+
+    magic, names_size, boolean_count, number_count, string_count, table_size = struct.unpack_from("<6h", data)
+    if magic == MAGIC_LEGACY:
+        number_format, number_size = "h", 2
+    elif magic == MAGIC_32BIT:
+        number_format, number_size = "i", 4
+    else:
+        raise ValueError(f"Unknown terminfo magic number {magic:#o}")
+
+    try:
+        offset = 12
+        aliases = data[offset:offset + names_size].split(b"\0", 1)[0].decode("ascii", errors="replace").split("|")
+        offset += names_size
+
+        booleans = {
+            BOOLEAN_NAMES[i]: True
+            for i, value in enumerate(data[offset:offset + min(boolean_count, len(BOOLEAN_NAMES))])
+            if value == 1
+        }
+        offset += boolean_count
+        # Numbers start on an even offset
+        offset += offset & 1
+
+        values = struct.unpack_from(f"<{number_count}{number_format}", data, offset)
+        numbers = {NUMBER_NAMES[i]: value for i, value in enumerate(values[:len(NUMBER_NAMES)]) if value >= 0}
+        offset += number_count * number_size
+
+        offsets = struct.unpack_from(f"<{string_count}h", data, offset)
+        offset += string_count * 2
+        table = data[offset:offset + table_size]
+        offset += table_size
+
+        strings = {
+            STRING_NAMES[i]: _table_string(table, position)
+            for i, position in enumerate(offsets[:len(STRING_NAMES)])
+            if position >= 0
+        }
+
+        _parse_extended(data, offset + (offset & 1), number_format, number_size, booleans, numbers, strings)
+    except struct.error as error:
+        raise ValueError("Truncated terminfo entry") from error
+
+    return Terminfo(aliases[0], aliases, booleans, numbers, strings)
+
+def _table_string(table: bytes, position: int) -> bytes:
+    end = table.find(b"\0", position)
+    return table[position:] if end == -1 else table[position:end]
+
+def _parse_extended(data: bytes, offset: int, number_format: str, number_size: int, booleans: Dict[str, bool], numbers: Dict[str, int], strings: Dict[str, bytes]):
+    # Extended section: header, booleans, numbers, string offsets, name
+    # offsets, then one table with the string values followed by the names
+    if len(data) - offset < 10:
+        return
+
+    boolean_count, number_count, string_count, _, table_size = struct.unpack_from("<5h", data, offset)
+    offset += 10
+
+    boolean_values = data[offset:offset + boolean_count]
+    offset += boolean_count
+    offset += offset & 1
+
+    number_values = struct.unpack_from(f"<{number_count}{number_format}", data, offset)
+    offset += number_count * number_size
+
+    string_offsets = struct.unpack_from(f"<{string_count}h", data, offset)
+    offset += string_count * 2
+
+    name_count = boolean_count + number_count + string_count
+    name_offsets = struct.unpack_from(f"<{name_count}h", data, offset)
+    offset += name_count * 2
+
+    table = data[offset:offset + table_size]
+
+    # Names are counted from the end of the last string value
+    names_start = 0
+    for position in string_offsets:
+        if position >= 0:
+            names_start = max(names_start, position + len(_table_string(table, position)) + 1)
+    names = [_table_string(table, names_start + position).decode("ascii", errors="replace") for position in name_offsets]
+
+    for i, value in enumerate(boolean_values):
+        if value == 1:
+            booleans[names[i]] = True
+    for i, value in enumerate(number_values):
+        if value >= 0:
+            numbers[names[boolean_count + i]] = value
+    for i, position in enumerate(string_offsets):
+        if position >= 0:
+            strings[names[boolean_count + number_count + i]] = _table_string(table, position)
+
+# MARK: Parameters
+def tparm(capability: bytes, *parameters: int) -> bytes:
+    """
+    # tparm(capability: bytes, *parameters: int) -> bytes
+    Apply parameters to a string capability, like curses.tparm. Supports
+    the full terminfo(5) language: %p, %P/%g variables, constants,
+    arithmetic, %i and %? %t %e %; conditions. Padding is dropped.
+    """
+
+    params = list(parameters) + [0] * (9 - len(parameters))
+    stack: List[Any] = []
+    variables: Dict[str, Any] = {}
+    out = bytearray()
+    text = capability.decode("latin-1")
+    length = len(text)
+    i = 0
+
+    def pop() -> Any:
+        return stack.pop() if stack else 0
+
+    while i < length:
+        char = text[i]
+        i += 1
+        if char != "%":
+            out += char.encode("latin-1")
+            continue
+        if i >= length:
+            break
+
+        op = text[i]
+        i += 1
+
+        if op == "%":
+            out += b"%"
+        elif op == "p":
+            stack.append(params[int(text[i]) - 1])
+            i += 1
+        elif op == "P":
+            variables[text[i]] = pop()
+            i += 1
+        elif op == "g":
+            stack.append(variables.get(text[i], 0))
+            i += 1
+        elif op == "'":
+            stack.append(ord(text[i]))
+            i += 2
+        elif op == "{":
+            end = text.index("}", i)
+            stack.append(int(text[i:end]))
+            i = end + 1
+        elif op == "i":
+            params[0] += 1
+            params[1] += 1
+        elif op == "c":
+            out += chr(pop() & 0xff).encode("latin-1")
+        elif op == "s":
+            out += str(pop()).encode("latin-1")
+        elif op == "l":
+            stack.append(len(str(pop())))
+        elif op in BINARY_OPERATORS:
+            b, a = pop(), pop()
+            stack.append(BINARY_OPERATORS[op](a, b))
+        elif op == "!":
+            stack.append(int(not pop()))
+        elif op == "~":
+            stack.append(~pop())
+        elif op == "?" or op == ";":
+            pass
+        elif op == "t":
+            if not pop():
+                i = _skip_branch(text, i, else_ends=True)
+        elif op == "e":
+            i = _skip_branch(text, i, else_ends=False)
+        else:
+            # printf style: %[[:]flags][width[.precision]][doxXs]
+            end = i - 1
+            while end < length and text[end] not in "doxXs":
+                end += 1
+            spec = "%" + text[i - 1:end + 1].lstrip(":")
+            value = pop()
+            if spec[-1] == "s":
+                value = str(value)
+            out += (spec % value).encode("latin-1")
+            i = end + 1
+
+    return PADDING.sub(b"", bytes(out))
+
+def _skip_branch(text: str, i: int, else_ends: bool) -> int:
+    # Skip to the matching %e (if else_ends) or %;, past nested conditions
+    depth = 0
+    length = len(text)
+    while i < length - 1:
+        if text[i] != "%":
+            i += 1
+            continue
+        op = text[i + 1]
+        i += 2
+        if op == "?":
+            depth += 1
+        elif op == ";":
+            if depth == 0:
+                return i
+            depth -= 1
+        elif op == "e" and else_ends and depth == 0:
+            return i
+    return length
+
+# MARK: Loading
+def terminfo_dirs() -> List[str]:
+    # Search order of ncurses
+    dirs: List[str] = []
+    if os.environ.get("TERMINFO"):
+        dirs.append(os.environ["TERMINFO"])
+    dirs.append(os.path.expanduser("~/.terminfo"))
+    for directory in os.environ.get("TERMINFO_DIRS", "").split(":"):
+        # An empty entry stands for the system directories
+        dirs.extend([directory] if directory else SYSTEM_DIRS)
+    dirs.extend(SYSTEM_DIRS)
+    return dirs
+
+def find_terminfo(term: str) -> Optional[str]:
+    if not term or "/" in term or term.startswith("."):
+        return None
+
+    for directory in terminfo_dirs():
+        # Letter directories (Linux) or hex directories (macOS)
+        for subdirectory in (term[0], f"{ord(term[0]):02x}"):
+            path = os.path.join(directory, subdirectory, term)
+            if os.path.isfile(path):
+                return path
+    return None
+
+def cache_path(term: str) -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "termlink", f"terminfo-{term}.json")
+
+def load_terminfo(term: Optional[str] = None, use_cache: bool = True) -> Optional[Terminfo]:
+    """
+    # load_terminfo(term: Optional[str] = None, use_cache: bool = True) -> Optional[Terminfo]
+    Load the terminfo entry of term ($TERM by default), None if there is
+    none. Parsed entries are kept in memory and, with use_cache, on disk
+    next to the source's path, mtime and size, so a changed entry is
+    parsed again.
+    """
+
+    term = term if term is not None else os.environ.get("TERM", "")
+    if term in terminfo_cache:
+        return terminfo_cache[term]
+
+    path = find_terminfo(term)
+    if path is None:
+        return None
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    stamp = [path, stat.st_mtime_ns, stat.st_size]
+
+    info = _read_cache(term, stamp) if use_cache else None
+    if info is None:
+        try:
+            with open(path, "rb") as file:
+                info = parse_terminfo(file.read())
+        except (OSError, ValueError):
+            return None
+        if use_cache:
+            _write_cache(term, stamp, info)
+
+    terminfo_cache[term] = info
+    return info
+
+def _read_cache(term: str, stamp: List[Any]) -> Optional[Terminfo]:
+    try:
+        with open(cache_path(term), "r", encoding="utf-8") as file:
+            cached = json.load(file)
+        if cached.get("version") != CACHE_VERSION or cached.get("source") != stamp:
+            return None
+        return Terminfo(
+            cached["name"],
+            cached["aliases"],
+            dict.fromkeys(cached["booleans"], True),
+            cached["numbers"],
+            {name: value.encode("latin-1") for name, value in cached["strings"].items()},
+        )
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+def _write_cache(term: str, stamp: List[Any], info: Terminfo):
+    cached = {
+        "version": CACHE_VERSION,
+        "source": stamp,
+        "name": info.name,
+        "aliases": info.aliases,
+        "booleans": list(info.booleans),
+        "numbers": info.numbers,
+        "strings": {name: value.decode("latin-1") for name, value in info.strings.items()},
+    }
+
+    path = cache_path(term)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so readers never see half a file
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(cached, file, separators=(",", ":"))
+        os.replace(temporary, path)
+    except OSError:
+        pass
@@ -8,15 +8,19 @@ from typing_extensions import Optional
 import E330
 from dataclasses import dataclass, field
 from typing import Callable, List
-from time import sleep
 import CtrlCodes
-from IOEscape import IOEscape, IOKeycode, IOModifiers, parse_keycode, escape_escape, IOEscape, parse_extra_key
+from IOEscape import IOEscape, IOEvent, IOKeycode, IOModifiers, IOPaste, parse_control_key
 from enum import Enum
 
 from TermlinkCommand import TermlinkCommand, TermlinkCommandRegistry, COMMAND_INDEX
+from RenderScheduler import RenderScheduler
 
 # MARK: CONSTANTS
 ESCAPE_SEQUENCE = "<esc>"
+# Longest wait for input when nothing needs drawing, input ends it early
+IDLE_TIMEOUT = 0.1
+# Pasted line breaks and tabs become spaces, other control characters are dropped
+PASTE_TRANSLATION = {**{c: None for c in range(0x20)}, 0x09: " ", 0x0a: " ", 0x0d: " ", 0x7f: None}
 
 
 class ExecutionState(Enum):
@@ -34,7 +38,6 @@ class Termlink:
 
     terminal: E330.E330
     input_buffer: str = ""
-    input_queue: str = ""
     cursor_position: int = 0
     execution_state: ExecutionState = ExecutionState.IDLE
     active: bool = True
@@ -43,11 +46,13 @@ class Termlink:
     current_selected_history: int = -1
 
     registry: TermlinkRegistry = field(default_factory=TermlinkRegistry)
+    scheduler: RenderScheduler = field(init=False)
 
 
     def __post_init__(self):
         self.events = []
-        self.terminal.subscribe_to_input(self.handle_key_press)
+        self.terminal.subscribe_to_keys(self.handle_key_event)
+        self.scheduler = RenderScheduler(self.terminal, self.print_prompt)
 
         for command in COMMAND_INDEX.values():
             self.registry.commands.register(command)
@@ -55,27 +60,24 @@ class Termlink:
     def bell(self):
         self.terminal.print("\a")
 
-    def input_queue_flush(self):
-        self.input_queue = ""
+    def handle_key_event(self, key: IOEvent):
+        if isinstance(key, IOPaste):
+            self.handle_paste(key.text)
+            return
 
-    def handle_key_press(self, key: str):
-        escaped_key = escape_escape(key, ESCAPE_SEQUENCE, "\\x1b")
-        self.input_queue += escaped_key
+        # Mouse events are not used by the shell
+        if not isinstance(key, IOKeycode):
+            return
 
-        input_queue_keycode = parse_keycode(self.input_queue, ESCAPE_SEQUENCE)
-        input_queue_extra = parse_extra_key(self.input_queue)
+        if key.is_special():
+            self.handle_special_key(key)
+            return
 
-
-        if input_queue_keycode.is_special():
-            if input_queue_keycode.is_possibly_incomplete():
-                return
-            self.handle_special_key(input_queue_keycode)
-        elif input_queue_extra != "":
-            self.handle_extra_key(input_queue_extra)
-        else:
-            self.handle_normal_key(input_queue_keycode)
-
-        self.input_queue_flush()
+        extra = parse_control_key(key.keycode)
+        if extra != "":
+            self.handle_extra_key(extra)
+        elif key.keycode_char.isprintable():
+            self.handle_normal_key(key)
 
     def handle_extra_key(self, key: str):
         handlers = {
@@ -112,6 +114,13 @@ class Termlink:
         )
         self.cursor_position += 1
 
+    def handle_paste(self, text: str):
+        # The whole paste is inserted with a single splice
+        text = text.replace("\r\n", "\n").translate(PASTE_TRANSLATION)
+        pos = self.cursor_position
+        self.input_buffer = self.input_buffer[:pos] + text + self.input_buffer[pos:]
+        self.cursor_position += len(text)
+
     def handle_enter_press(self):
 
         self.command(self.input_buffer)
@@ -176,8 +185,7 @@ class Termlink:
             self.bell()
 
     def handle_ctrl_c(self):
-        global RUNNING
-        RUNNING = False
+        self.active = False
 
     def print_prompt(self):
         reset_position = CtrlCodes.clear_line() + CtrlCodes.cursor_beginning_of_line()
@@ -205,37 +213,56 @@ class Termlink:
     def command(self, command: str):
         self.history.append(command)
 
-        self.terminal.print("\r\n")
+        # The command output goes out as one frame
+        with self.terminal.frame():
+            self.terminal.print("\r\n")
 
-        # Get the command corresponding to the input from the registry
-        termlinkcmd = self.registry.commands.get_command_for_shell_input(command)
+            # Get the command corresponding to the input from the registry
+            termlinkcmd = self.registry.commands.get_command_for_shell_input(command)
 
-        if termlinkcmd:
-            # Run the command
-            termlinkcmd.handle(self, command)
-        else:
-            tcmd = self.registry.commands.get_command_for_shell_input("_unrecognized_command", builtin=True)
-            if tcmd:
-                tcmd.handle(self, command)
+            if termlinkcmd:
+                # Run the command
+                termlinkcmd.handle(self, command)
             else:
-                self.terminal.print("FATAL: expected builtin _unrecognized_command to be in registry")
+                tcmd = self.registry.commands.get_command_for_shell_input("_unrecognized_command", builtin=True)
+                if tcmd:
+                    tcmd.handle(self, command)
+                else:
+                    self.terminal.print("FATAL: expected builtin _unrecognized_command to be in registry")
+
+            self.terminal.print("\r\n")
+
+
+    def step(self, timeout: float = 0):
+        # One pass of the main loop. Key handlers run here, on the calling
+        # thread, a batch at a time. Input marks the prompt dirty, it is
+        # redrawn once per frame however many keys came in.
+        due = self.scheduler.timeout()
+        if due is not None:
+            timeout = min(timeout, due)
+        if self.terminal.process_input(timeout=timeout):
+            self.scheduler.invalidate()
+        self.scheduler.tick()
+        self.terminal.flush()
 
-        self.terminal.print("\r\n")
 
+def main(terminal: Optional[E330.E330] = None) -> Termlink:
+    # Any E330 works, e.g. VirtualE330 to run headless
+    terminal = terminal if terminal is not None else E330.E330()
+    termlink = Termlink(terminal)
 
-RUNNING = True
+    terminal.initialize_terminal()
+    terminal.start_input_thread()
+    terminal.print(CtrlCodes.clear_screen())
+    terminal.print(CtrlCodes.restore_cursor_position())
 
-terminal = E330.E330()
-termlink = Termlink(terminal)
+    while termlink.active:
+        termlink.step(timeout=IDLE_TIMEOUT)
 
-terminal.initialize_terminal()
-terminal.start_input_thread()
-terminal.print(CtrlCodes.clear_screen())
-terminal.print(CtrlCodes.restore_cursor_position())
+    terminal.stop_input_thread()
+    terminal.shutdown_terminal()
+    return termlink
 
-while RUNNING:
-    termlink.print_prompt()
-    sleep(0.001)
 
-terminal.stop_input_thread()
-terminal.shutdown_terminal()
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 
 from CtrlCodes import FG_BLACK, FG_RED, FG_GREEN, FG_YELLOW, FG_BLUE, FG_MAGENTA, FG_CYAN, FG_WHITE, RESET
 from enum import Enum, auto
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Optional, TextIO
+import sys
+
+import CellField as cf
 
 class Color(Enum):
     black = 0
@@ -64,26 +70,76 @@ LINE_CHARACTERS = {
     },
 }
 
+COLOR_CODES = {
+    Color.black: FG_BLACK,
+    Color.red: FG_RED,
+    Color.green: FG_GREEN,
+    Color.yellow: FG_YELLOW,
+    Color.blue: FG_BLUE,
+    Color.magenta: FG_MAGENTA,
+    Color.cyan: FG_CYAN,
+    Color.white: FG_WHITE,
+    Color.default: RESET
+}
+
 def colorcode_for_color(c: Color):
-    return {
-        Color.black: FG_BLACK,
-        Color.red: FG_RED,
-        Color.green: FG_GREEN,
-        Color.yellow: FG_YELLOW,
-        Color.blue: FG_BLUE,
-        Color.magenta: FG_MAGENTA,
-        Color.cyan: FG_CYAN,
-        Color.white: FG_WHITE,
-        Color.default: RESET
-    }[c]
+    return COLOR_CODES[c]
 
 def colored_text(text: str, color: Color):
     return colorcode_for_color(color) + text + colorcode_for_color(Color.default)
 
 
-def render_frame(style: FrameStyle, width: int, height: int, color: Color = Color.default):
+@lru_cache(maxsize=128)
+def frame_text(style: FrameStyle, width: int, height: int, color: Color = Color.default) -> str:
+    # The finished frame, every line colored and ended with a newline.
+    # Cached, as panels are redrawn with the same few sizes over and over.
+    if style == FrameStyle.none:
+        return ""
     lines = LINE_CHARACTERS[style]
-    print(colored_text(lines["top_left"] + lines["horizontal"] * (width - 2) + lines["top_right"], color))
-    for _ in range(height - 2):
-        print(colored_text(lines["vertical"] + " " * (width - 2) + lines["vertical"], color))
-    print(colored_text(lines["bottom_left"] + lines["horizontal"] * (width - 2) + lines["bottom_right"], color))
+    top = colored_text(lines["top_left"] + lines["horizontal"] * (width - 2) + lines["top_right"], color) + "\n"
+    middle = colored_text(lines["vertical"] + " " * (width - 2) + lines["vertical"], color) + "\n"
+    bottom = colored_text(lines["bottom_left"] + lines["horizontal"] * (width - 2) + lines["bottom_right"], color) + "\n"
+    return top + middle * (height - 2) + bottom
+
+def render_frame(style: FrameStyle, width: int, height: int, color: Color = Color.default, stream: Optional[TextIO] = None) -> str:
+    # Writes the whole frame with a single write, and returns it
+    text = frame_text(style, width, height, color)
+    out = sys.stdout if stream is None else stream
+    out.write(text)
+    out.flush()
+    return text
+
+@lru_cache(maxsize=64)
+def frame_cells(style: FrameStyle, color: Color = Color.default) -> Mapping[str, "cf.Cell"]:
+    # The border cells of a style, shared by every frame drawn with it, so
+    # the mapping is read-only. FrameStyle.none has no cells.
+    border_color = cf.Color(color.value)
+    return MappingProxyType({
+        name: cf.Cell(character).fg_color(border_color)
+        for name, character in LINE_CHARACTERS.get(style, {}).items()
+    })
+
+def draw_frame(field: "cf.CellField", style: FrameStyle, x: int = 0, y: int = 0, width: Optional[int] = None, height: Optional[int] = None, color: Color = Color.default) -> "cf.CellField":
+    # Draws the frame into a CellField, by default around the whole field.
+    # FrameStyle.none draws nothing.
+    if style == FrameStyle.none:
+        return field
+    width = field.width - x if width is None else width
+    height = field.height - y if height is None else height
+    cells = frame_cells(style, color)
+    right = x + width - 1
+    bottom = y + height - 1
+
+    for column in range(x + 1, right):
+        field.set(column, y, cells["horizontal"])
+        field.set(column, bottom, cells["horizontal"])
+    for row in range(y + 1, bottom):
+        field.set(x, row, cells["vertical"])
+        field.set(right, row, cells["vertical"])
+
+    field.set(x, y, cells["top_left"])
+    field.set(right, y, cells["top_right"])
+    field.set(x, bottom, cells["bottom_left"])
+    field.set(right, bottom, cells["bottom_right"])
+
+    return field
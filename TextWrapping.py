@@ -1,6 +1,11 @@
-from dataclasses import dataclass
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import List
+import re
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from TextWidth import char_width, display_width, fit_width
 
 
 class WrappingBehaviour(Enum):
@@ -9,6 +14,41 @@ class WrappingBehaviour(Enum):
     HYPHENATE = 2
     TRUNCATE = 3
     TRUNCATE_WITH_ELLIPSIS = 4
+    BALANCED = 5
+    ANSI = 6
+
+# MARK: Constants
+# Matches a whole word or a single newline, everything else is a word separator.
+WORD_TOKEN = re.compile(r"[^\s]+|\n")
+# Matches the (possibly empty) run of word characters at the start of a chunk.
+LEADING_WORD = re.compile(r"[^\s]*")
+# Tokenizes text containing escape sequences. The groups are, in order:
+# escape sequence (CSI or two byte), newline, whitespace, visible text.
+ANSI_TOKEN = re.compile(r"(\x1b\[[0-?]*[ -/]*[@-~]|\x1b[@-Z\\-_])|(\n)|([^\S\n]+)|([^\s\x1b]+|\x1b)")
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-?]*[ -/]*[@-~]|\x1b[@-Z\\-_]")
+ANSI_RESET = "\x1b[0m"
+# Parameters of an SGR sequence (ESC [ ... m) that set attributes, private
+# ones such as ESC [ > 4 ; 2 m are not styles
+SGR_PARAMETERS = re.compile(r"[0-9;:]*")
+# SGR codes by the attribute they set, every attribute is one slot of the
+# style state, so setting it again replaces the old value
+SGR_SLOTS = {
+    1: "bold", 2: "dim", 3: "italic", 4: "underline", 21: "underline",
+    5: "blink", 6: "blink", 7: "inverse", 8: "conceal", 9: "strike", 53: "overline",
+    **{code: "foreground" for code in (*range(30, 38), *range(90, 98))},
+    **{code: "background" for code in (*range(40, 48), *range(100, 108))},
+}
+# Codes turning attributes off
+SGR_OFF = {
+    22: ("bold", "dim"), 23: ("italic",), 24: ("underline",), 25: ("blink",),
+    27: ("inverse",), 28: ("conceal",), 29: ("strike",), 55: ("overline",),
+    39: ("foreground",), 49: ("background",), 59: ("underline_color",),
+}
+# Colors given by more parameters: 38;5;n or 38;2;r;g;b (or 38:2::r:g:b)
+SGR_EXTENDED = {38: "foreground", 48: "background", 58: "underline_color"}
+# Whitespace that word based wrapping would rewrite: anything but single
+# spaces between words.
+UNNORMALIZED_SPACE = re.compile(r"[^\S ]|  |^ | $")
 
 @dataclass
 class TextWrapping:
@@ -26,17 +66,60 @@ class TextWrapping:
             return self.truncate_wrap(text)
         elif self.method == WrappingBehaviour.TRUNCATE_WITH_ELLIPSIS:
             return self.truncate_with_ellipsis_wrap(text)
+        elif self.method == WrappingBehaviour.BALANCED:
+            return self.balanced_wrap(text)
+        elif self.method == WrappingBehaviour.ANSI:
+            return self.ansi_wrap(text)
+        else:
+            raise ValueError(f"Invalid wrapping method: {self.method}")
+
+    def wrap_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        # wrap_stream(chunks: Iterable[str]) -> Iterator[str]
+        Lazily wrap text that arrives in chunks (e.g. an open file, or a list
+        of strings), yielding each wrapped line as soon as it is complete.
+
+        Chunks may be cut anywhere, even in the middle of a word. Newlines
+        always end the current line, so only the line being built is held
+        in memory, regardless of the size of the input. BALANCED needs to see
+        a whole paragraph before breaking it, so it holds one paragraph.
+        """
+
+        if self.method == WrappingBehaviour.WORD:
+            return self._fill_words(self._measure(self._iter_words(chunks)), 0, "")
+        elif self.method == WrappingBehaviour.HARD:
+            return self._iter_hard_lines(chunks)
+        elif self.method == WrappingBehaviour.HYPHENATE:
+            return self._fill_words(self._measure(self._iter_words(chunks)), 1, "-")
+        elif self.method == WrappingBehaviour.TRUNCATE:
+            return self._iter_truncated_lines(chunks, "")
+        elif self.method == WrappingBehaviour.TRUNCATE_WITH_ELLIPSIS:
+            return self._iter_truncated_lines(chunks, "...")
+        elif self.method == WrappingBehaviour.BALANCED:
+            return self._balance_words(self._measure(self._iter_words(chunks)))
+        elif self.method == WrappingBehaviour.ANSI:
+            return self._iter_ansi_lines(self._iter_text_lines(chunks))
         else:
             raise ValueError(f"Invalid wrapping method: {self.method}")
 
+    def reflow(self, index: "WrapIndex") -> List[str]:
+        # Word based methods only walk the precomputed break opportunities,
+        # the others are plain slicing and simply wrap the text again.
+        if self.method == WrappingBehaviour.WORD:
+            return list(self._fill_words(zip(index.words, index.widths), 0, ""))
+        elif self.method == WrappingBehaviour.HYPHENATE:
+            return list(self._fill_words(zip(index.words, index.widths), 1, "-"))
+        elif self.method == WrappingBehaviour.BALANCED:
+            return list(self._balance_words(zip(index.words, index.widths)))
+        return self.wrap(index.text)
+
     def word_wrap(self, text: str) -> List[str]:
         # Algorithm:
-            # Split the text into words
-            # Initialize a list of lines
-            # Initialize a current line string
+            # Split the text into words (newlines are kept as line breaks)
+            # Initialize a list of words on the current line
             # For each word:
-                # If adding the word to the current line would exceed the width:
-                    # Add the current line to the list of lines
+                # If the word and its separating space would exceed the width:
+                    # Join the current words into a line
                     # Start a new current line with the word
                     # Continue
                 # Otherwise:
@@ -45,92 +128,29 @@ class TextWrapping:
 
             # Add the last current line to the list of lines
 
-        words = text.split()
-        lines = []
-        current_line = ""
-
-        for word in words:
-            if len(current_line) + len(word) > self.width:
-                lines.append(current_line)
-                current_line = word
-            else:
-                if current_line:
-                    current_line += " "
-                current_line += word
-
-        lines.append(current_line)
-
-        return lines
+        return list(self._fill_words(self._measure(self._iter_words((text,))), 0, ""))
 
     def hard_wrap(self, text: str) -> List[str]:
         # Algorithm:
-            # Initialize a list of lines
-            # Initialize a current line string
-            # For each character in the text:
-                # If adding the character to the current line would exceed the width:
-                    # Add the current line to the list of lines
-                    # Start a new current line with the character
-                    # Continue
-                # Otherwise:
-                    # Add the character to the current line
-                    # Continue
-            # Add the last current line to the list of lines
+            # For each line (.split("\n")) in the text:
+                # Slice the line into pieces of exactly width characters
+                # The last piece holds the remainder
             # Return the list of lines
 
-        lines = []
-        current_line = ""
-
-        for char in text:
-            if len(current_line) + 1 > self.width:
-                lines.append(current_line)
-                current_line = char
-            else:
-                current_line += char
-
-        lines.append(current_line)
-
-        return lines
+        return list(self._iter_hard_lines((text,)))
 
     def hyphenate_wrap(self, text: str) -> List[str]:
         # Algorithm:
-            # Split the text into words
-            # Initialize a list of lines
-            # Initialize a current line string
-            # For each word:
-                # If adding the word to the current line would exceed the width - 1:
-                    # Add a hyphen to the current line
-                    # Add the current line to the list of lines
-                    # Start a new current line with the word
-                    # Continue
-                # Otherwise:
-                    # Add the word to the current line
-                    # Continue
-
-            # Add the last current line to the list of lines
-            # Return the list of lines
-
-        words = text.split()
-        lines = []
-        current_line = ""
-
-        for word in words:
-            if len(current_line) + len(word) + 1 > self.width:
-                current_line += "-"
-                lines.append(current_line)
-                current_line = word
-            else:
-                if current_line:
-                    current_line += " "
-                current_line += word
-
-        lines.append(current_line)
+            # Same as word_wrap, but one column is kept free at the end of
+            # every line, and a hyphen is added to lines that were broken
+            # Words that do not fit in width - 1 columns are split over
+            # several lines, each piece but the last ending in a hyphen
 
-        return lines
+        return list(self._fill_words(self._measure(self._iter_words((text,))), 1, "-"))
 
     def truncate_wrap(self, text: str) -> List[str]:
         # Algorithm:
             # Initialize a list of lines
-            # Initialize a current line string
             # For each line (.split("\n")) in the text:
                 # If the line is longer than the width:
                     # Truncate the line to the width
@@ -139,20 +159,11 @@ class TextWrapping:
                 # Continue
             # Return the list of lines
 
-        lines = []
-        current_line = ""
-
-        for line in text.split("\n"):
-            if len(line) > self.width:
-                line = line[:self.width]
-            lines.append(line)
-
-        return lines
+        return list(self._iter_truncated_lines((text,), ""))
 
     def truncate_with_ellipsis_wrap(self, text: str) -> List[str]:
         # Algorithm:
             # Initialize a list of lines
-            # Initialize a current line string
             # For each line (.split("\n")) in the text:
                 # If the line is longer than the width:
                     # Truncate the line to the width - 3
@@ -162,12 +173,659 @@ class TextWrapping:
                 # Continue
             # Return the list of lines
 
-        lines = []
-        current_line = ""
+        return list(self._iter_truncated_lines((text,), "..."))
+
+    def balanced_wrap(self, text: str) -> List[str]:
+        # Algorithm:
+            # Split the text into paragraphs of words (at newlines)
+            # For each paragraph:
+                # Choose the breaks that minimize the sum of the squared
+                # free space at the end of every line but the last
+                # (minimum raggedness, as in Knuth-Plass without stretching)
+            # Return the list of lines
+
+        return list(self._balance_words(self._measure(self._iter_words((text,)))))
+
+    def ansi_wrap(self, text: str) -> List[str]:
+        # Algorithm:
+            # Scan the text into escape sequences, whitespace and visible text
+            # Build words from the visible text and the escapes inside them
+            # Word wrap on the visible width only, hard splitting words that
+            # are wider than a whole line (escapes are never cut)
+            # Track the active SGR style while placing words:
+                # A line that ends with a style active gets a reset
+                # The next line starts by re-opening that style
+            # Return the list of lines
+
+        return list(self._iter_ansi_lines(text.split("\n")))
+
+    # MARK: Streaming internals
+    def _iter_words(self, chunks: Iterable[str]) -> Iterator[str]:
+        # Yields every word, and a "\n" token for every newline. A word that
+        # touches the end of a chunk is carried over, since the next chunk
+        # may continue it.
+        carry = ""
+
+        for chunk in chunks:
+            position = 0
+
+            if carry:
+                leading = LEADING_WORD.match(chunk)
+                position = leading.end()
+                carry += leading.group()
+
+                if position == len(chunk):
+                    continue
+
+                yield carry
+                carry = ""
+
+            end = len(chunk)
+            for match in WORD_TOKEN.finditer(chunk, position):
+                if match.end() == end and match.group() != "\n":
+                    carry = match.group()
+                    break
+                yield match.group()
+
+        if carry:
+            yield carry
+
+    def _measure(self, words: Iterable[str]) -> Iterator[Tuple[str, int]]:
+        for word in words:
+            yield word, display_width(word)
+
+    def _fill_words(self, words: Iterable[Tuple[str, int]], reserve: int, marker: str) -> Iterator[str]:
+        # Greedy fill: `reserve` columns are kept free on every line so that
+        # `marker` can be appended to lines that end in a break.
+        limit = self.width - reserve
+        if limit < 1:
+            # No room for the marker
+            limit, marker = max(self.width, 1), ""
+        line: List[str] = []
+        line_width = 0
+
+        for word, word_width in words:
+            if word == "\n":
+                yield " ".join(line)
+                line = []
+                line_width = 0
+                continue
+
+            if reserve and word_width > limit:
+                # A word wider than a line is broken into pieces of limit
+                # columns, each followed by the marker
+                if line:
+                    yield " ".join(line) + (marker if line_width <= limit else "")
+                # A wide character that does not fit at all goes out alone,
+                # without the marker
+                while word_width > limit and len(word) > 1:
+                    cut, columns = fit_width(word, limit)
+                    if cut == 0:
+                        cut, columns = 1, char_width(word[0])
+                    yield word[:cut] + (marker if columns <= limit else "")
+                    word = word[cut:]
+                    word_width -= columns
+                line = [word]
+                line_width = word_width
+            elif line and line_width + 1 + word_width > limit:
+                yield " ".join(line) + (marker if line_width <= limit else "")
+                line = [word]
+                line_width = word_width
+            else:
+                line_width += word_width + 1 if line else word_width
+                line.append(word)
+
+        yield " ".join(line)
+
+    def _balance_words(self, words: Iterable[Tuple[str, int]]) -> Iterator[str]:
+        paragraph: List[str] = []
+        widths: List[int] = []
+
+        for word, word_width in words:
+            if word == "\n":
+                yield from self._balance_paragraph(paragraph, widths)
+                paragraph = []
+                widths = []
+                continue
+
+            paragraph.append(word)
+            widths.append(word_width)
+
+        yield from self._balance_paragraph(paragraph, widths)
+
+    def _balance_paragraph(self, words: List[str], widths: List[int]) -> Iterator[str]:
+        count = len(words)
+        if count == 0:
+            yield ""
+            return
+
+        breaks = balanced_breaks(widths, self.width)
+        for start, end in zip(breaks, breaks[1:]):
+            yield " ".join(words[start:end])
+
+    def _iter_text_lines(self, chunks: Iterable[str]) -> Iterator[str]:
+        # Reassembles complete lines, the last line is always yielded.
+        pending: List[str] = []
+
+        for chunk in chunks:
+            start = 0
+            while True:
+                newline = chunk.find("\n", start)
+                if newline == -1:
+                    if start < len(chunk):
+                        pending.append(chunk[start:])
+                    break
+
+                pending.append(chunk[start:newline])
+                yield "".join(pending)
+                pending = []
+                start = newline + 1
+
+        yield "".join(pending)
+
+    def _iter_ansi_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        width = max(self.width, 1)
+        # The SGR attributes in effect, reset whenever a line ends styled
+        # and re-opened by one sequence on the next line
+        style: Dict[str, str] = {}
+        line: List[str] = []
+        line_width = 0
+        # The word being built, as (text, is_escape) parts
+        word: List[Tuple[str, bool]] = []
+        word_width = 0
+
+        def apply_style(sequence: str):
+            if sequence.endswith("m") and sequence.startswith("\x1b[") and SGR_PARAMETERS.fullmatch(sequence, 2, len(sequence) - 1):
+                update_sgr_state(style, sequence[2:-1])
+
+        def close_line() -> str:
+            if style:
+                line.append(ANSI_RESET)
+            closed = "".join(line)
+            line.clear()
+            if style:
+                line.append(sgr_sequence(style))
+            return closed
+
+        for text in lines:
+            for match in ANSI_TOKEN.finditer(text + " "):
+                kind = match.lastindex
+
+                if kind == 1:
+                    word.append((match.group(), True))
+                    continue
+
+                if kind == 4:
+                    word.append((match.group(), False))
+                    word_width += display_width(match.group())
+                    continue
+
+                # Whitespace ends the current word, place it on the line.
+                if not word:
+                    continue
+
+                if word_width == 0:
+                    for part, is_escape in word:
+                        line.append(part)
+                        if is_escape:
+                            apply_style(part)
+                    word.clear()
+                    continue
+
+                if line_width and line_width + 1 + word_width > width:
+                    yield close_line()
+                    line_width = 0
+
+                if line_width:
+                    line.append(" ")
+                    line_width += 1
+
+                for part, is_escape in word:
+                    if is_escape:
+                        line.append(part)
+                        apply_style(part)
+                        continue
+
+                    # Only words wider than the line are split here.
+                    start = 0
+                    split, columns = fit_width(part, width - line_width)
+                    while split < len(part):
+                        if split == start and line_width == 0:
+                            # A wide character on a one column line
+                            split, columns = start + 1, char_width(part[start])
+                        line.append(part[start:split])
+                        yield close_line()
+                        line_width = 0
+                        start = split
+                        split, columns = fit_width(part, width, start)
+
+                    line.append(part[start:])
+                    line_width += columns
+
+                word.clear()
+                word_width = 0
+
+            yield close_line()
+            line_width = 0
+
+    def _iter_hard_lines(self, chunks: Iterable[str]) -> Iterator[str]:
+        width = max(self.width, 1)
+        pending: List[str] = []
+        pending_width = 0
+
+        for chunk in chunks:
+            start = 0
+            end = len(chunk)
+
+            while start < end:
+                newline = chunk.find("\n", start)
+                stop = end if newline == -1 else newline
+
+                segment = chunk[start:stop]
+
+                if segment.isascii() and segment.isprintable():
+                    # Only break once more text follows, so a line that
+                    # exactly fills the width is not followed by an empty line.
+                    position = 0
+                    while len(segment) - position > width - pending_width:
+                        split = position + width - pending_width
+                        pending.append(segment[position:split])
+                        yield "".join(pending)
+                        pending = []
+                        pending_width = 0
+                        position = split
+
+                    if position < len(segment):
+                        pending.append(segment[position:])
+                        pending_width += len(segment) - position
+                else:
+                    for char in segment:
+                        columns = char_width(char)
+                        if pending_width and pending_width + columns > width:
+                            yield "".join(pending)
+                            pending = []
+                            pending_width = 0
+                        pending.append(char)
+                        pending_width += columns
+
+                if newline == -1:
+                    break
+
+                yield "".join(pending)
+                pending = []
+                pending_width = 0
+                start = newline + 1
+
+        yield "".join(pending)
+
+    def _iter_truncated_lines(self, chunks: Iterable[str], marker: str) -> Iterator[str]:
+        # Only the first width + 1 columns of a line are kept, which is
+        # enough to tell whether the line has to be truncated.
+        keep = self.width + 1
+        head: List[str] = []
+        head_width = 0
+
+        for chunk in chunks:
+            start = 0
+
+            while True:
+                newline = chunk.find("\n", start)
+                stop = len(chunk) if newline == -1 else newline
+
+                # Every character is at most one column wide for this bound
+                # except zero width ones, hence the loop.
+                position = start
+                while head_width < keep and position < stop:
+                    piece = chunk[position:min(stop, position + keep - head_width)]
+                    head.append(piece)
+                    head_width += display_width(piece)
+                    position += len(piece)
+
+                if newline == -1:
+                    break
+
+                yield self._truncate("".join(head), marker)
+                head = []
+                head_width = 0
+                start = newline + 1
+
+        yield self._truncate("".join(head), marker)
+
+    def _truncate(self, line: str, marker: str) -> str:
+        if display_width(line) > self.width:
+            # The marker itself is clipped on lines narrower than it
+            if len(marker) >= self.width:
+                return marker[:max(self.width, 0)]
+            cut, _ = fit_width(line, self.width - len(marker))
+            return line[:cut] + marker
+        return line
+
+
+@dataclass
+class WrapIndex:
+    """
+    # WrapIndex
+    The break opportunities of a text, computed once so the text can be
+    reflowed to any width without tokenizing it again.
+
+    Properties:
+
+        (*) text        The indexed text.
+                        @Type: str
+
+        (*) words       The words of the text, with a "\n" entry for every
+                        newline.
+                        @Type: List[str]
+
+        (*) widths      The width of every entry in words.
+                        @Type: List[int]
+    """
+
+    text: str
+    words: List[str]
+    widths: List[int]
+
+    @staticmethod
+    def build(text: str) -> "WrapIndex":
+        words = [match.group() for match in WORD_TOKEN.finditer(text)]
+        return WrapIndex(text, words, [display_width(word) for word in words])
+
+@dataclass
+class WrapCache:
+    """
+    # WrapCache
+    LRU cache of wrapped text, keyed by (text, width, method). Texts that
+    were already wrapped at another width are reflowed from their cached
+    WrapIndex, which makes rewrapping everything after a resize cheap.
+
+    Properties:
+
+        (*) max_results The number of wrapped results to keep.
+                        @Type: int
+                        @Default: 1024
+
+        (*) max_indexes The number of WrapIndex objects to keep.
+                        @Type: int
+                        @Default: 256
+    """
+
+    max_results: int = 1024
+    max_indexes: int = 256
+    hits: int = 0
+    misses: int = 0
+    _results: "OrderedDict[Tuple[str, int, WrappingBehaviour], Tuple[str, ...]]" = field(default_factory=OrderedDict, repr=False)
+    _indexes: "OrderedDict[str, WrapIndex]" = field(default_factory=OrderedDict, repr=False)
+
+    def wrap(self, text: str, width: int, method: WrappingBehaviour) -> List[str]:
+        # Strings cache their hash, so looking up a text that was seen
+        # before does not scan it again.
+        key = (text, width, method)
+        lines = self._results.get(key)
+
+        if lines is not None:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return list(lines)
+
+        self.misses += 1
+        lines = tuple(TextWrapping(method, width).reflow(self.index(text)))
+
+        self._results[key] = lines
+        if len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+        return list(lines)
+
+    def index(self, text: str) -> WrapIndex:
+        index = self._indexes.get(text)
+
+        if index is not None:
+            self._indexes.move_to_end(text)
+            return index
+
+        index = WrapIndex.build(text)
+
+        self._indexes[text] = index
+        if len(self._indexes) > self.max_indexes:
+            self._indexes.popitem(last=False)
+
+        return index
+
+    def clear(self):
+        self._results.clear()
+        self._indexes.clear()
+        self.hits = 0
+        self.misses = 0
+
+def visible_width(text: str) -> int:
+    # The width of text, not counting escape sequences
+    return display_width(ANSI_ESCAPE.sub("", text))
+
+def update_sgr_state(state: Dict[str, str], parameters: str):
+    """
+    # update_sgr_state(state: Dict[str, str], parameters: str)
+    Apply the parameters of one SGR sequence to a style state, which maps
+    every attribute that is on to the parameters that set it. Off codes
+    clear their attribute and 0 (or nothing) clears all of them, so the
+    state never holds more than one entry per attribute.
+    """
+
+    codes = parameters.split(";")
+    index = 0
+    while index < len(codes):
+        code = codes[index]
+        index += 1
+        head = code.split(":", 1)[0]
+        if head and not head.isdigit():
+            continue
+        number = int(head) if head else 0
+
+        if number == 0:
+            state.clear()
+        elif number in SGR_EXTENDED:
+            if ":" not in code:
+                # The color follows as separate parameters
+                mode = codes[index] if index < len(codes) else ""
+                count = 2 if mode == "5" else 4 if mode == "2" else 0
+                code = ";".join(codes[index - 1:index + count])
+                index += count
+            state[SGR_EXTENDED[number]] = code
+        elif number in SGR_OFF:
+            for slot in SGR_OFF[number]:
+                state.pop(slot, None)
+        elif code == "4:0":
+            state.pop("underline", None)
+        else:
+            state[SGR_SLOTS.get(number, head)] = code
+
+def sgr_sequence(state: Dict[str, str]) -> str:
+    # One sequence turning on everything in the state ("" if nothing is on)
+    if not state:
+        return ""
+    return "\x1b[" + ";".join(state.values()) + "m"
+
+def wrap_many(texts: Sequence[str], width: int, method: WrappingBehaviour, workers: int = 0, chunk_size: int = 4096) -> List[List[str]]:
+    """
+    # wrap_many(texts: Sequence[str], width: int, method: WrappingBehaviour, workers: int = 0, chunk_size: int = 4096) -> List[List[str]]
+    Wrap many texts at once, returning the wrapped lines of each text in
+    the same order.
+
+    Parameters:
+
+        (*) texts:              The texts to wrap.
+                                @Type Sequence[str];
+                                @Required;
+
+        (*) width:              The maximum line width.
+                                @Type int;
+                                @Required;
+
+        (*) method:             The wrapping behaviour to use.
+                                @Type WrappingBehaviour;
+                                @Required;
+
+        (*) workers:            Number of worker processes for batches
+                                larger than chunk_size, 0 wraps in the
+                                calling process.
+                                @Default int(0);
+                                @Type int;
+
+        (*) chunk_size:         Number of texts sent to a worker at once.
+                                @Default int(4096);
+                                @Type int;
+
+    Texts that already fit on one line are returned as they are, without
+    going through the wrapper.
+    """
+
+    if workers > 0 and len(texts) > chunk_size:
+        batches = [(texts[start:start + chunk_size], width, method) for start in range(0, len(texts), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results: List[List[str]] = []
+            for wrapped in executor.map(wrap_batch, batches):
+                results.extend(wrapped)
+            return results
+
+    return wrap_batch((texts, width, method))
+
+def wrap_batch(batch: Tuple[Sequence[str], int, WrappingBehaviour]) -> List[List[str]]:
+    # A single argument so it can be handed to ProcessPoolExecutor.map
+    texts, width, method = batch
+    wrapper = TextWrapping(method, width)
+    wrap = wrapper.wrap
+
+    # Which texts can skip wrapping depends on the method: word based
+    # methods would normalize whitespace, hyphenation keeps a column free
+    # and ANSI wrapping may add a reset, or drop the space before a zero
+    # width word (a lone combining mark), so it only skips printable ASCII.
+    limit = width - 1 if method == WrappingBehaviour.HYPHENATE else width
+    check_spaces = method in (WrappingBehaviour.WORD, WrappingBehaviour.HYPHENATE, WrappingBehaviour.BALANCED, WrappingBehaviour.ANSI)
+    check_ascii = method == WrappingBehaviour.ANSI
+
+    results: List[List[str]] = []
+    append = results.append
+    for text in texts:
+        if (
+            "\n" not in text
+            and display_width(text) <= limit
+            and not (check_spaces and UNNORMALIZED_SPACE.search(text))
+            and not (check_ascii and not (text.isascii() and text.isprintable()))
+        ):
+            append([text])
+        else:
+            append(wrap(text))
+
+    return results
+
+# Shared by every view, so unchanged text is only wrapped once per width.
+WRAP_CACHE = WrapCache()
+
+
+def balanced_breaks(widths: List[int], width: int) -> List[int]:
+    """
+    # balanced_breaks(widths: List[int], width: int) -> List[int]
+    Find the line breaks of minimum raggedness for a paragraph.
+
+    Parameters:
+
+        (*) widths:             The width of every word.
+                                @Type List[int];
+                                @Required;
+
+        (*) width:              The maximum line width.
+                                @Type int;
+                                @Required;
+
+    Return Value:
+
+        (*) The index of the first word of every line, followed by
+            len(widths), so line n is words[breaks[n]:breaks[n + 1]]
+            @Type List[int]
+
+    The cost of a line is the square of its free space, and a line that
+    overflows costs more than any layout without overflow (which is only
+    chosen for words longer than the width). That cost is a convex function
+    of the line length, so the cost matrix is Monge and the best break for
+    a word never moves left as the word moves right. Candidate breaks are
+    kept in a queue, each owning the range of words it is best for, and a
+    new candidate takes over a suffix of that range found by binary search:
+    O(n log n) instead of the naive O(n^2).
+    """
+
+    count = len(widths)
+
+    # offsets[k] - offsets[i] - 1 is the length of a line holding words i..k-1
+    offsets = [0] * (count + 1)
+    for k, word_width in enumerate(widths):
+        offsets[k + 1] = offsets[k] + word_width + 1
+
+    overflow_penalty = (count + 1) * max(width, 1) ** 2 + 1
+    best = [0] * (count + 1)
+    previous = [0] * (count + 1)
+
+    def cost(i: int, j: int) -> int:
+        slack = width - (offsets[j] - offsets[i] - 1)
+        if slack >= 0:
+            return best[i] + slack * slack
+        return best[i] + overflow_penalty * slack * slack
+
+    # candidates[n] is the best break for words starting at starts[n]
+    candidates = [0]
+    starts = [1]
+    head = 0
+
+    for j in range(1, count + 1):
+        while head + 1 < len(candidates) and starts[head + 1] <= j:
+            head += 1
+
+        previous[j] = candidates[head]
+        best[j] = cost(candidates[head], j)
+
+        if j == count:
+            break
+
+        # Drop the candidates that j beats over their whole range
+        while len(candidates) > head:
+            start = max(starts[-1], j + 1)
+            if cost(j, start) <= cost(candidates[-1], start):
+                candidates.pop()
+                starts.pop()
+            else:
+                break
+
+        if len(candidates) == head:
+            candidates.append(j)
+            starts.append(j + 1)
+            continue
+
+        # Binary search the first position where j beats the last candidate
+        low = max(starts[-1], j + 1) + 1
+        high = count + 1
+        while low < high:
+            middle = (low + high) // 2
+            if cost(j, middle) <= cost(candidates[-1], middle):
+                high = middle
+            else:
+                low = middle + 1
+
+        if low <= count:
+            candidates.append(j)
+            starts.append(low)
+
+    # The last line is free, so pick the cheapest start among the ones
+    # that fit on the last line (or the last word on its own).
+    last = count - 1
+    i = count - 2
+    while i >= 0 and offsets[count] - offsets[i] - 1 <= width:
+        if best[i] <= best[last]:
+            last = i
+        i -= 1
 
-        for line in text.split("\n"):
-            if len(line) > self.width:
-                line = line[:self.width - 3] + "..."
-            lines.append(line)
+    breaks = [count]
+    while last > 0:
+        breaks.append(last)
+        last = previous[last]
+    breaks.append(0)
+    breaks.reverse()
 
-        return lines
+    return breaks
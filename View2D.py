@@ -5,7 +5,8 @@ from enum import Enum
 from dataclasses import dataclass, field
 import math
 
-from TextWrapping import WrappingBehaviour, TextWrapping
+from TextWrapping import WrappingBehaviour, WRAP_CACHE
+from TextWidth import char_width, display_width
 
 class View2DFlowDirection(Enum):
     ROWS = 0
@@ -40,6 +41,13 @@ class View2DSize():
     def auto() -> 'View2DSize':
         return View2DSize(View2DSizing.AUTO, 0)
 
+@dataclass(frozen=True)
+class View2DConstraint():
+    # Space given to a view, what parent callbacks return. The root
+    # constraint is usually the terminal size (E330.get_size).
+    width: int
+    height: int
+
 @dataclass
 class View2D:
     children: Optional[List['View2D']] = None
@@ -72,52 +80,73 @@ class View2D:
         #  case _:
         #   Raise an exception
 
-        sum_width = sum(child.width for child in rendered_children) + self.spacing * (len(rendered_children) - 1)
-        max_height = max(child.height for child in rendered_children)
-        sum_height = sum(child.height for child in rendered_children) + self.spacing * (len(rendered_children) - 1)
-        max_width = max(child.width for child in rendered_children)
+        parent = parent_callback() if parent_callback is not None else None
 
         # SIZING
-        if self.width.type == View2DSizing.FIXED:
-            max_width = self.width.value
+        # FIXED and FILL sizes are known up front, AUTO sizes come from the children
+        width = self.resolve_size(self.width, parent.width if parent is not None else None, "width")
+        height = self.resolve_size(self.height, parent.height if parent is not None else None, "height")
+
+        # Algorithm:
+        #   (1) render the children that do not fill, with the known space
+        #   (2) give the FILL children the space that is left along the flow
+        #       and the full cross size (the widest / tallest child for AUTO)
+        #   (3) size an AUTO view by its children
+        rows = self.direction == View2DFlowDirection.ROWS
+        if not rows and self.direction != View2DFlowDirection.COLUMNS:
+            raise ValueError("Invalid direction")
 
-        if self.height.type == View2DSizing.FIXED:
-            sum_height = self.height.value
+        def fills(child: 'View2D') -> bool:
+            return child.width.type == View2DSizing.FILL or child.height.type == View2DSizing.FILL
 
-        if self.width.type == View2DSizing.FILL:
+        available = View2DConstraint(
+            width if width is not None else (parent.width if parent is not None else 0),
+            height if height is not None else (parent.height if parent is not None else 0),
+        )
 
-            if parent_callback is not None:
-                max_width = parent_callback().width
+        rendered: List[Optional[CellField]] = [None] * len(self.children)
+        for i, child in enumerate(self.children):
+            if not fills(child):
+                rendered[i] = child.render(parent_callback=lambda: available)
 
-                self.width = View2DSize.fixed(max_width)
-            else:
-                raise Exception("Cannot fill width without parent callback")
+        measured = [f for f in rendered if f is not None]
+        fill_count = len(self.children) - len(measured)
+        spacing = self.spacing * (len(self.children) - 1)
 
-        if self.height.type == View2DSizing.FILL:
-            if parent_callback is not None:
-                sum_height = parent_callback().height
+        if rows:
+            cross = width if width is not None else max((f.width for f in measured), default=0)
+            flow = height - sum(f.height for f in measured) - spacing if height is not None else 0
+            fill_constraint = View2DConstraint(cross, max(0, flow) // max(1, fill_count))
+        else:
+            cross = height if height is not None else max((f.height for f in measured), default=0)
+            flow = width - sum(f.width for f in measured) - spacing if width is not None else 0
+            fill_constraint = View2DConstraint(max(0, flow) // max(1, fill_count), cross)
 
-                self.height = View2DSize.fixed(sum_height)
-            else:
-                raise Exception("Cannot fill height without parent callback")
+        for i, child in enumerate(self.children):
+            if rendered[i] is None:
+                rendered[i] = child.render(parent_callback=lambda: fill_constraint)
 
-        def pcallback():
-            return {
-                "width": max_width,
-                "height": sum_height
-            }
+        rendered_children = [f for f in rendered if f is not None]
 
-        for child in self.children:
-            rendered_children.append(child.render(parent_callback=pcallback))
+        sum_width = sum(child.width for child in rendered_children) + spacing
+        max_height = max((child.height for child in rendered_children), default=0)
+        sum_height = sum(child.height for child in rendered_children) + spacing
+        max_width = max((child.width for child in rendered_children), default=0)
 
-        if self.direction == View2DFlowDirection.ROWS:
-            field = CellField(max_width, sum_height)
+        # Content size, and the size of the view
+        content_width, content_height = (max_width, sum_height) if rows else (sum_width, max_height)
+        if width is None:
+            width = content_width
+        if height is None:
+            height = content_height
+
+        if rows:
+            field = CellField(width, height)
 
             if self.justification == View2DJustification.CENTER:
-                current_y = math.floor((sum_height - sum_height) / 2)
+                current_y = math.floor((height - content_height) / 2)
             elif self.justification == View2DJustification.END:
-                # currently identity, when different padding is added, this will be updated
-                current_y = sum_height - sum_height
+                current_y = height - content_height
             else:
                 current_y = 0
 
@@ -132,9 +161,9 @@ class View2D:
                 # The x position will be the width of the field minus the width of the child
 
                 if self.alignment == View2DAlignment.CENTER:
-                    current_x = math.floor((max_width - child.width) / 2)
+                    current_x = math.floor((width - child.width) / 2)
                 elif self.alignment == View2DAlignment.RIGHT:
-                    current_x = max_width - child.width
+                    current_x = width - child.width
                 else:
                     current_x = 0
 
@@ -144,14 +173,13 @@ class View2D:
 
             return field
 
-        elif self.direction == View2DFlowDirection.COLUMNS:
-            field = CellField(sum_width, max_height)
+        else:
+            field = CellField(width, height)
 
             if self.justification == View2DJustification.CENTER:
-                current_x = math.floor((sum_width - sum_width) / 2)
+                current_x = math.floor((width - content_width) / 2)
             elif self.justification == View2DJustification.END:
-                # currently identity, when different padding is added, this will be updated
-                current_x = sum_width - sum_width
+                current_x = width - content_width
             else:
                 current_x = 0
 
@@ -160,9 +188,9 @@ class View2D:
                     continue
 
                 if self.alignment == View2DAlignment.CENTER:
-                    current_y = math.floor((max_height - child.height) / 2)
+                    current_y = math.floor((height - child.height) / 2)
                 elif self.alignment == View2DAlignment.RIGHT:
-                    current_y = max_height - child.height
+                    current_y = height - child.height
                 else:
                     current_y = 0
 
@@ -174,8 +202,17 @@ class View2D:
 
             return field
 
-        else:
-            raise ValueError("Invalid direction")
+    def resolve_size(self, size: View2DSize, parent: Optional[int], dimension: str) -> Optional[int]:
+        # The size along one dimension, None for AUTO (sized by the content).
+        # FILL sizes are taken from the constraint on every render, so a
+        # resized terminal is picked up by the next render.
+        if size.type == View2DSizing.FIXED:
+            return size.value
+        if size.type == View2DSizing.FILL:
+            if parent is None:
+                raise Exception(f"Cannot fill {dimension} without parent callback")
+            return parent
+        return None
 
     def debug(self, f: CellField):
         if self.debug_bg and f.field is not None:
@@ -205,11 +242,12 @@ class PaddedView2D(View2D):
         if self.children[0] is None:
             return CellField(0, 0)
 
-        def pcallback():
-            return {
-                "width": self.children[0].width,
-                "height": self.children[0].height
-            }
+        # The child gets the parent's space, less the padding
+        pcallback = None
+        if parent_callback is not None:
+            parent = parent_callback()
+            inner = View2DConstraint(max(0, parent.width - self.padding * 2), max(0, parent.height - self.padding * 2))
+            pcallback = lambda: inner
 
         # Render the child
         child_field = self.children[0].render(parent_callback=pcallback)
@@ -234,13 +272,31 @@ class PrimitiveTextView2D(View2D):
 
     def render(self, parent_callback: Optional[Callable] = None) -> CellField:
         # Create a field with the text
-        field = CellField(len(self.text), 1)
+        field = CellField(display_width(self.text), 1)
 
         if field.field is None:
             return field
 
-        for i, c in enumerate(self.text):
-            field.set(i, 0, Cell(character=c))
+        x = 0
+        for c in self.text:
+            columns = char_width(c)
+
+            # Zero width characters (combining marks) join the previous cell
+            if columns == 0:
+                if x > 0:
+                    previous = x - 1 if field.get(x - 1, 0).character else x - 2
+                    cell = field.get(previous, 0)
+                    field.set(previous, 0, Cell(character=cell.character + c, properties=cell.properties))
+                continue
+
+            field.set(x, 0, Cell(character=c))
+
+            # The second column of a wide character is an empty cell, so the
+            # rendered row keeps its width
+            if columns == 2:
+                field.set(x + 1, 0, Cell(character=""))
+
+            x += columns
 
         return field
 
@@ -250,7 +306,7 @@ class TextView2D(View2D):
     wrap: WrappingBehaviour = WrappingBehaviour.WORD
 
     def render(self, parent_callback: Optional[Callable] = None) -> CellField:
-        split_lines_max_width = max(len(line) for line in self.text.split("\n"))
+        split_lines_max_width = max(display_width(line) for line in self.text.split("\n"))
         max_width = self.width.value
 
         if self.width.type == View2DSizing.AUTO:
@@ -260,14 +316,11 @@ class TextView2D(View2D):
                 raise ValueError("Parent callback must be provided when using FILL sizing, but none was provided")
             max_width = parent_callback().width
 
-        wrapper = TextWrapping(self.wrap, max_width)
-        wrapped_text = wrapper.wrap(self.text)
+        wrapped_text = WRAP_CACHE.wrap(self.text, max_width, self.wrap)
 
         # Create a view2d that stacks a textview2d for each line
         children = [PrimitiveTextView2D(text=line) for line in wrapped_text]
 
-        print(children)
-
         # ignore this error, TextView2D is a subclass of View2D, so it should be fine
         stack = View2D(children=children, direction=View2DFlowDirection.ROWS, alignment=View2DAlignment.LEFT, spacing=0)
 
@@ -285,7 +338,14 @@ class BorderedView2D(View2D):
             return CellField(0, 0)
 
 
-        content_field = self.content.render()
+        # The content gets the parent's space, less the padding
+        pcallback = None
+        if parent_callback is not None:
+            parent = parent_callback()
+            inner = View2DConstraint(max(0, parent.width - self.padding * 2), max(0, parent.height - self.padding * 2))
+            pcallback = lambda: inner
+
+        content_field = self.content.render(parent_callback=pcallback)
         border_field = CellField(content_field.width + self.padding * 2, content_field.height + self.padding * 2)
 
         # Custom border function that will draw a border around the field
@@ -332,7 +392,10 @@ class BorderedView2D(View2D):
 @dataclass
 class SpacerView2D(View2D):
     def render(self, parent_callback: Optional[Callable] = None) -> CellField:
-        c = CellField(self.width.value, self.height.value)
+        parent = parent_callback() if parent_callback is not None else None
+        width = self.resolve_size(self.width, parent.width if parent is not None else None, "width")
+        height = self.resolve_size(self.height, parent.height if parent is not None else None, "height")
+        c = CellField(width or 0, height or 0)
 
 
         self.debug(c)
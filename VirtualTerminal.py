@@ -0,0 +1,524 @@
+#
+# VIRTUALTERMINAL - IN-MEMORY TERMINAL
+# A small xterm-like emulator that keeps the screen in a CellField, and an
+# E330 that writes to it instead of the tty. Runs Termlink and View2D
+# headless, for tests and load benchmarks.
+#
+
+import codecs
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from CellField import ANSIColor, Cell, CellField, CellProperties, Color
+from E330 import E330, TerminalSize
+from InputQueue import InputQueue
+from IOEscape import IOResize
+from Terminfo import Terminfo
+from TextWidth import char_width
+
+# MARK: Constants
+TAB_WIDTH = 8
+
+# Parser states
+GROUND = 0
+ESCAPE = 1
+CSI = 2
+OSC = 3
+CHARSET = 4
+
+# SGR attributes switched on (and off with the code + 20)
+SGR_ATTRIBUTES: Dict[int, str] = {
+    1: "bold",
+    3: "italic",
+    4: "underlined",
+    5: "blink",
+    7: "inverse",
+    8: "invisible",
+    9: "strikethrough",
+}
+SGR_RESET_ATTRIBUTES: Dict[int, Tuple[str, ...]] = {
+    22: ("bold",),
+    23: ("italic",),
+    24: ("underlined",),
+    25: ("blink",),
+    27: ("inverse",),
+    28: ("invisible",),
+    29: ("strikethrough",),
+}
+
+# MARK: Functions
+def extended_color(value: str) -> Color:
+    # Colors CellField has no constructor for (256 palette), as the
+    # parameters after 38; / 48;
+    color = Color(ANSIColor.default)
+    color.is_ansicolor = False
+    color.ansi_value = value
+    return color
+
+def parse_color(parameters: List[int], index: int) -> Tuple[Optional[Color], int]:
+    # 38 / 48 sub parameters at index: 5;n or 2;r;g;b. Returns the color and
+    # the index of the last parameter used.
+    if index < len(parameters) and parameters[index] == 5 and index + 1 < len(parameters):
+        return extended_color(f"5;{parameters[index + 1]}"), index + 1
+    if index < len(parameters) and parameters[index] == 2 and index + 3 < len(parameters):
+        red, green, blue = parameters[index + 1:index + 4]
+        return extended_color(f"2;{red};{green};{blue}"), index + 3
+    return None, index
+
+# MARK: Classes
+@dataclass
+class VirtualTerminal:
+    """
+    # VirtualTerminal
+    @dataclass
+
+    Interprets the output of E330 / OutputBuilder / CtrlCodes and keeps
+    the resulting screen. Understands cursor motion, erasing, SGR (basic,
+    bright, 256 and RGB colors), autowrap, scrolling, wide and combining
+    characters, save / restore cursor and the private modes we set
+    (alternate screen, cursor visibility, synchronized updates, bracketed
+    paste, mouse). Other sequences are counted and ignored.
+
+    Properties:
+
+        (*) width, height           Screen size in cells
+                                    @Type: int
+
+        (*) screen                  The visible screen
+                                    @Type: CellField
+
+        (*) x, y                    Cursor position, 0-based
+                                    @Type: int
+
+        (*) modes                   Private modes set (? h / l)
+                                    @Type: Dict[int, bool]
+
+        (*) bytes_received          Bytes fed
+        (*) sequences               Escape sequences seen
+        (*) sequence_counts         Sequences by kind, "CSI H", "CSI m", "ESC 7",
+                                    "OSC", ...
+        (*) bells                   BEL characters seen
+
+    Methods:
+
+        (*) feed                    Interpret output bytes
+        (*) text                    Screen contents as plain text
+        (*) line                    One row as plain text
+        (*) cell                    The Cell at x, y
+        (*) resize                  Change the screen size
+    """
+
+    width: int = 80
+    height: int = 24
+    screen: CellField = field(init=False)
+    x: int = 0
+    y: int = 0
+    properties: CellProperties = field(default_factory=CellProperties)
+    modes: Dict[int, bool] = field(default_factory=dict)
+    # xterm delays the wrap until the next character after the last column
+    wrap_pending: bool = False
+    saved_cursor: Tuple[int, int, Any] = (0, 0, None)
+    saved_screen: Optional[CellField] = None
+    bytes_received: int = 0
+    sequences: int = 0
+    sequence_counts: Counter = field(default_factory=Counter)
+    bells: int = 0
+    state: int = field(init=False, default=GROUND)
+    parameters: List[str] = field(init=False, default_factory=list)
+    text_decoder: Any = field(init=False, default_factory=lambda: codecs.getincrementaldecoder("utf-8")(errors="replace"))
+
+    def __post_init__(self):
+        self.screen = CellField(self.width, self.height)
+
+    # MARK: Inspection
+    def line(self, y: int) -> str:
+        return "".join(self.screen.get(x, y).character for x in range(self.width)).rstrip()
+
+    def text(self) -> str:
+        return "\n".join(self.line(y) for y in range(self.height)).rstrip("\n")
+
+    def cell(self, x: int, y: int) -> Cell:
+        return self.screen.get(x, y)
+
+    def resize(self, width: int, height: int):
+        screen = CellField(width, height)
+        for y in range(min(height, self.height)):
+            for x in range(min(width, self.width)):
+                screen.set(x, y, self.screen.get(x, y))
+        self.screen = screen
+        self.width = width
+        self.height = height
+        self.x = min(self.x, width - 1)
+        self.y = min(self.y, height - 1)
+        self.wrap_pending = False
+
+    # MARK: Parsing
+    def feed(self, data: bytes):
+        self.bytes_received += len(data)
+
+        for char in self.text_decoder.decode(data):
+            state = self.state
+
+            if state == GROUND:
+                if char >= " " and char != "\x7f":
+                    self._put(char)
+                elif char == "\x1b":
+                    self.state = ESCAPE
+                else:
+                    self._control(char)
+
+            elif state == ESCAPE:
+                self.state = GROUND
+                if char == "[":
+                    self.state = CSI
+                    self.parameters = []
+                elif char == "]":
+                    self.state = OSC
+                elif char in "()*+":
+                    self.state = CHARSET
+                else:
+                    self._escape(char)
+
+            elif state == CSI:
+                if "\x20" <= char <= "\x3f":
+                    self.parameters.append(char)
+                elif "\x40" <= char <= "\x7e":
+                    self.state = GROUND
+                    self._csi("".join(self.parameters), char)
+                else:
+                    self.state = GROUND
+
+            elif state == OSC:
+                # Ends with BEL or ST (ESC \), the title is not kept
+                if char == "\x07":
+                    self._count("OSC")
+                    self.state = GROUND
+                elif char == "\x1b":
+                    self._count("OSC")
+                    self.state = ESCAPE
+
+            else:  # CHARSET, one designator
+                self._count("ESC (")
+                self.state = GROUND
+
+    def _count(self, kind: str):
+        self.sequences += 1
+        self.sequence_counts[kind] += 1
+
+    # MARK: Characters
+    def _put(self, char: str):
+        columns = char_width(char)
+
+        # Combining marks join the previous cell
+        if columns == 0:
+            x = self.x - 1 if not self.wrap_pending else self.x
+            if x >= 0:
+                if self.screen.get(x, self.y).character == "" and x > 0:
+                    x -= 1
+                cell = self.screen.get(x, self.y)
+                self.screen.set(x, self.y, Cell(cell.character + char, cell.properties))
+            return
+
+        if self.wrap_pending or self.x + columns > self.width:
+            self.x = 0
+            self._line_feed()
+            self.wrap_pending = False
+
+        self.screen.set(self.x, self.y, Cell(char, self.properties))
+        if columns == 2:
+            self.screen.set(self.x + 1, self.y, Cell("", self.properties))
+
+        self.x += columns
+        if self.x >= self.width:
+            self.x = self.width - 1
+            self.wrap_pending = True
+
+    def _control(self, char: str):
+        self.wrap_pending = False
+        if char == "\r":
+            self.x = 0
+        elif char == "\n" or char == "\x0b" or char == "\x0c":
+            self._line_feed()
+        elif char == "\b":
+            self.x = max(0, self.x - 1)
+        elif char == "\t":
+            self.x = min(self.width - 1, (self.x // TAB_WIDTH + 1) * TAB_WIDTH)
+        elif char == "\x07":
+            self.bells += 1
+
+    def _line_feed(self):
+        if self.y < self.height - 1:
+            self.y += 1
+        else:
+            self._scroll_up(1)
+
+    def _scroll_up(self, n: int):
+        field = self.screen.field
+        if field is None:
+            return
+        n = min(n, self.height)
+        del field.array[:n]
+        field.array.extend([Cell(" ") for _ in range(self.width)] for _ in range(n))
+
+    def _scroll_down(self, n: int):
+        field = self.screen.field
+        if field is None:
+            return
+        n = min(n, self.height)
+        del field.array[self.height - n:]
+        field.array[:0] = [[Cell(" ") for _ in range(self.width)] for _ in range(n)]
+
+    def _erase(self, x0: int, y0: int, x1: int, y1: int):
+        # Cells from (x0, y0) up to, not including, (x1, y1), in reading order
+        blank = Cell(" ", self.properties)
+        for y in range(y0, y1 + 1):
+            start = x0 if y == y0 else 0
+            end = x1 if y == y1 else self.width
+            for x in range(start, end):
+                self.screen.set(x, y, blank)
+
+    # MARK: Sequences
+    def _escape(self, char: str):
+        self._count(f"ESC {char}")
+        if char == "7":
+            self.saved_cursor = (self.x, self.y, self.properties)
+        elif char == "8":
+            self.x, self.y, properties = self.saved_cursor
+            if properties is not None:
+                self.properties = properties
+        elif char == "c":
+            self.__post_init__()
+            self.x = self.y = 0
+            self.properties = CellProperties()
+        elif char == "D":
+            self._line_feed()
+        elif char == "M":
+            if self.y > 0:
+                self.y -= 1
+            else:
+                self._scroll_down(1)
+        elif char == "E":
+            self.x = 0
+            self._line_feed()
+
+    def _csi(self, parameter_text: str, final: str):
+        self._count(f"CSI {parameter_text[:1] if parameter_text[:1] in '?<>=' else ''}{final}")
+
+        private = parameter_text[:1] == "?"
+        if private:
+            parameter_text = parameter_text[1:]
+        parameters = [int(p) if p.isdigit() else 0 for p in parameter_text.split(";")] if parameter_text else []
+
+        def parameter(i: int = 0, default: int = 1) -> int:
+            value = parameters[i] if i < len(parameters) else 0
+            return value if value else default
+
+        if final != "m":
+            self.wrap_pending = False
+
+        if private:
+            if final == "h" or final == "l":
+                for mode in parameters:
+                    self._private_mode(mode, final == "h")
+            return
+
+        if final == "m":
+            self._sgr(parameters or [0])
+        elif final == "H" or final == "f":
+            self.y = min(self.height - 1, parameter(0) - 1)
+            self.x = min(self.width - 1, parameter(1) - 1)
+        elif final == "A":
+            self.y = max(0, self.y - parameter())
+        elif final == "B":
+            self.y = min(self.height - 1, self.y + parameter())
+        elif final == "C":
+            self.x = min(self.width - 1, self.x + parameter())
+        elif final == "D":
+            self.x = max(0, self.x - parameter())
+        elif final == "E":
+            self.x = 0
+            self.y = min(self.height - 1, self.y + parameter())
+        elif final == "F":
+            self.x = 0
+            self.y = max(0, self.y - parameter())
+        elif final == "G" or final == "`":
+            self.x = min(self.width - 1, parameter() - 1)
+        elif final == "d":
+            self.y = min(self.height - 1, parameter() - 1)
+        elif final == "J":
+            mode = parameter(0, 0)
+            if mode == 0:
+                self._erase(self.x, self.y, self.width, self.height - 1)
+            elif mode == 1:
+                self._erase(0, 0, self.x + 1, self.y)
+            else:
+                self._erase(0, 0, self.width, self.height - 1)
+        elif final == "K":
+            mode = parameter(0, 0)
+            if mode == 0:
+                self._erase(self.x, self.y, self.width, self.y)
+            elif mode == 1:
+                self._erase(0, self.y, self.x + 1, self.y)
+            else:
+                self._erase(0, self.y, self.width, self.y)
+        elif final == "X":
+            self._erase(self.x, self.y, min(self.width, self.x + parameter()), self.y)
+        elif final == "P" or final == "@":
+            row = self.screen.field.array[self.y] if self.screen.field is not None else []
+            n = min(parameter(), self.width - self.x)
+            if final == "P":
+                del row[self.x:self.x + n]
+                row.extend(Cell(" ") for _ in range(n))
+            else:
+                row[self.x:self.x] = [Cell(" ") for _ in range(n)]
+                del row[self.width:]
+        elif final == "S":
+            self._scroll_up(parameter())
+        elif final == "T":
+            self._scroll_down(parameter())
+        elif final == "s":
+            self.saved_cursor = (self.x, self.y, None)
+        elif final == "u":
+            self.x, self.y, _ = self.saved_cursor
+
+    def _private_mode(self, mode: int, enabled: bool):
+        previous = self.modes.get(mode, False)
+        self.modes[mode] = enabled
+
+        # Alternate screen, with the cursor saved (1049)
+        if mode == 1049 and enabled != previous:
+            if enabled:
+                self.saved_cursor = (self.x, self.y, self.properties)
+                self.saved_screen = self.screen
+                self.screen = CellField(self.width, self.height)
+            else:
+                if self.saved_screen is not None:
+                    self.screen = self.saved_screen
+                    self.saved_screen = None
+                self.x, self.y, _ = self.saved_cursor
+
+    def _sgr(self, parameters: List[int]):
+        properties = self.properties.copy()
+        i = 0
+        while i < len(parameters):
+            code = parameters[i]
+            if code == 0:
+                properties = CellProperties()
+            elif code in SGR_ATTRIBUTES:
+                setattr(properties, SGR_ATTRIBUTES[code], True)
+            elif code in SGR_RESET_ATTRIBUTES:
+                for name in SGR_RESET_ATTRIBUTES[code]:
+                    setattr(properties, name, False)
+            elif 30 <= code <= 37 or code == 39:
+                properties.foreground_color = Color(code - 30)
+            elif 40 <= code <= 47 or code == 49:
+                properties.background_color = Color(code - 40)
+            elif 90 <= code <= 97:
+                properties.foreground_color = extended_color(f"5;{code - 82}")
+            elif 100 <= code <= 107:
+                properties.background_color = extended_color(f"5;{code - 92}")
+            elif code == 38 or code == 48:
+                color, i = parse_color(parameters, i + 1)
+                if color is not None:
+                    if code == 38:
+                        properties.foreground_color = color
+                    else:
+                        properties.background_color = color
+            i += 1
+        self.properties = properties
+
+@dataclass
+class FrameStats:
+    # One write to the virtual terminal
+    bytes: int
+    sequences: int
+
+@dataclass
+class VirtualE330(E330):
+    """
+    # VirtualE330
+    @dataclass
+
+    E330 writing into a VirtualTerminal instead of the tty. Output is
+    flushed into the emulator, input is given with send(), and nothing
+    touches stdin, stdout or signals.
+
+    Properties:
+
+        (*) terminal_screen         The emulator
+                                    @Type: VirtualTerminal
+
+        (*) frame_stats             Bytes and sequences of every flush
+                                    @Type: List[FrameStats]
+
+    Methods:
+
+        (*) send                    Input bytes, decoded and queued like
+                                    bytes read from the tty. Each call is
+                                    complete input, a trailing ESC is
+                                    taken as the Escape key.
+
+        (*) resize                  Resize the screen and report it
+    """
+
+    terminfo: Optional[Terminfo] = None
+    synchronized_updates: Optional[bool] = True
+    terminal_screen: VirtualTerminal = field(default_factory=VirtualTerminal)
+    frame_stats: List[FrameStats] = field(init=False, default_factory=list)
+    # send() usually runs on the thread that calls process_input(), where a
+    # full queue would block forever, so the queue takes everything sent
+    input_queue: Optional[InputQueue] = field(default_factory=lambda: InputQueue(capacity=sys.maxsize))
+
+    # Terminal Initialization and Shutdown
+    def install_resize_handler(self):
+        pass
+
+    def uninstall_resize_handler(self):
+        pass
+
+    def shutdown_terminal(self):
+        # Same as E330, without ending the process
+        self.restore_terminal()
+
+    # Threading, input comes from send()
+    def start_input_thread(self):
+        pass
+
+    def stop_input_thread(self):
+        pass
+
+    # Input
+    def send(self, data: bytes):
+        self.handle_input_bytes(data)
+        self.dispatch_events(self.decoder.flush())
+
+    # Size
+    def read_size(self) -> TerminalSize:
+        return TerminalSize(self.terminal_screen.width, self.terminal_screen.height)
+
+    def resize(self, width: int, height: int):
+        self.terminal_screen.resize(width, height)
+        self.size = TerminalSize(width, height)
+        self.dispatch_events([IOResize(width, height)])
+
+    # Output
+    def flush(self):
+        with self.output_lock:
+            self.flush_deadline = None
+            if not self.output_buffer:
+                return
+
+            data = bytes(self.output_buffer)
+            self.output_buffer.clear()
+
+            sequences = self.terminal_screen.sequences
+            self.terminal_screen.feed(data)
+            self.frame_stats.append(FrameStats(len(data), self.terminal_screen.sequences - sequences))
+            self.write_calls += 1
+            self.bytes_written += len(data)
+
+    def output_writable(self) -> bool:
+        # The emulator takes everything at once
+        return True
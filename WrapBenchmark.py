@@ -0,0 +1,59 @@
+#
+# WRAP BENCHMARK
+# Measures wrapping throughput in lines per second, per call and batched.
+# Usage: python WrapBenchmark.py [records] [width] [workers]
+#
+
+import random
+import sys
+import time
+from typing import Callable, List
+
+from TextWrapping import TextWrapping, WrappingBehaviour, wrap_many
+
+# Texts the batch shortcut has to get right: odd whitespace, escapes,
+# combining marks, zero width and wide characters
+EDGE_RECORDS = ["", " ", "a  b", " a", "a ", "a\tb", "a\nb", "\x1b[1mbold\x1b[0m", "-bb \u0301", "\u65e5\u65e5\u00e9 \u0301", "a \u200b b", "\ufe0f \ufe0f-bba", "\u00ad \x00\u0301", "\U0001f600 x"]
+WORDS = ["request", "handled", "in", "ms", "user", "cache", "miss", "GET", "/api/v1/items", "200", "timeout", "retrying", "worker", "queue"]
+
+def make_records(count: int, seed: int = 0) -> List[str]:
+    # Mostly short records that fit on one line, with some long ones
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        length = rng.choice((4, 6, 8, 10, 30))
+        records.append(" ".join(rng.choice(WORDS) for _ in range(length)))
+    return records
+
+def check_parity(records: List[str], width: int):
+    # wrap_many() must give exactly what wrap() gives, record by record
+    for method in WrappingBehaviour:
+        wrapper = TextWrapping(method, width)
+        for record, wrapped in zip(records, wrap_many(records, width, method)):
+            if wrapped != wrapper.wrap(record):
+                raise RuntimeError(f"wrap_many() differs from wrap() for {method.name} at width {width}: {record!r}")
+
+def measure(name: str, records: List[str], run: Callable[[], List[List[str]]]):
+    start = time.perf_counter()
+    wrapped = run()
+    elapsed = time.perf_counter() - start
+    lines = sum(len(result) for result in wrapped)
+    print(f"{name:<28} {len(records) / elapsed:>12,.0f} records/s {lines / elapsed:>12,.0f} lines/s")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    records = make_records(count)
+    for parity_width in (1, 2, 5, width):
+        check_parity(EDGE_RECORDS + records[:1000], parity_width)
+
+    print(f"{count} records, width {width}")
+    for method in (WrappingBehaviour.WORD, WrappingBehaviour.HARD, WrappingBehaviour.ANSI):
+        print(f"[{method.name}]")
+        measure("wrap() per record", records, lambda: [TextWrapping(method, width).wrap(record) for record in records])
+        measure("wrap_many()", records, lambda: wrap_many(records, width, method))
+        measure(f"wrap_many(workers={workers})", records, lambda: wrap_many(records, width, method, workers=workers))
+
+if __name__ == "__main__":
+    main()